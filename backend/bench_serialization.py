@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of the list endpoint serialization paths.
+
+Compares the previous path (build a model per document, let FastAPI validate
+the list against response_model and encode it with the stdlib json encoder)
+with fast_list_response (projected documents encoded with orjson).
+
+Usage: python bench_serialization.py [rows] [repeats]
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import ChatMessage, fast_list_response
+
+
+def make_documents(rows):
+    start = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "session_id": "bench-session",
+            "user_id": "bench-user",
+            "content": "Silav! Ev peyamek ji bo ceribandinê ye. " * 8,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "timestamp": start + timedelta(seconds=i),
+            "language": "ku",
+        }
+        for i in range(rows)
+    ]
+
+
+def model_path(documents, field):
+    content = [ChatMessage(**document) for document in documents]
+    encoded = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(encoded).body
+
+
+def fast_path(documents):
+    return fast_list_response(documents, ChatMessage).body
+
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    field = create_response_field(name="Response", type_=List[ChatMessage])
+
+    # Each run gets fresh documents, as a Mongo cursor would hand back
+    model_time = timed(lambda: model_path(make_documents(rows), field), repeats)
+    fast_time = timed(lambda: fast_path(make_documents(rows)), repeats)
+    build_time = timed(lambda: make_documents(rows), repeats)
+
+    model_time -= build_time
+    fast_time -= build_time
+    print(f"rows={rows} repeats={repeats} (best of)")
+    print(f"model + response_model + json: {model_time * 1e6 / rows:8.2f} us/row")
+    print(f"projection + orjson:           {fast_time * 1e6 / rows:8.2f} us/row")
+    print(f"speedup:                       {model_time / fast_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Response compression for JSON endpoints.
+
+Uses brotli (with gzip fallback) when the optional brotli-asgi package is
+installed, otherwise Starlette's gzip middleware. Paths that stream live
+output are passed through untouched: the compressors buffer internally, which
+would hold back deltas a client is waiting for, and the export endpoints
+already offer their own gzip.
+"""
+
+from typing import Tuple
+
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, skip_prefixes: Tuple[str, ...] = ()):
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.skip_prefixes):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,125 @@
+"""
+Server-side buffer for LLM generations.
+
+Each reply to /api/chat/send is produced by a background task that writes its
+output into a Generation. The request handler waits on it, but the task does
+not depend on the client: if the connection drops the reply is still finished
+and persisted, and the client can reattach through
+GET /api/chat/generations/{id} (or resend with the same generation_id) instead
+of paying for a second generation.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+
+class Generation:
+    def __init__(self, user_id: str, session_id: Optional[str], generation_id: Optional[str] = None):
+        self.id = generation_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.session_id = session_id
+        self.chunks: List[str] = []
+        self.length = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.message_id: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    async def append(self, chunk: str):
+        if not chunk:
+            return
+        async with self._changed:
+            self.chunks.append(chunk)
+            self.length += len(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, message_id: Optional[str] = None, error: Optional[str] = None):
+        async with self._changed:
+            self.done = True
+            self.message_id = message_id
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def wait(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done)
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[str]:
+        """Yield the text from `offset` onwards: what is buffered, then live chunks."""
+        sent = offset
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.length > sent or self.done)
+                text = self.text[sent:]
+                done = self.done
+            if text:
+                sent += len(text)
+                yield text
+            if done:
+                return
+
+
+class GenerationStore:
+    """Bounded, TTL-expiring map of generation id to Generation.
+
+    Finished generations are kept for `ttl_seconds` so late reattaches can
+    still read them. When more than `max_entries` are held, the oldest are
+    dropped; a dropped generation that is still running keeps going and is
+    persisted, it just can no longer be reattached to.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[str, Generation]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def create(self, user_id: str, session_id: Optional[str], generation_id: Optional[str] = None) -> Generation:
+        """Register a new generation; raises KeyError if the id is taken.
+
+        Callers create the generation before their first await, so a resend
+        racing the original finds it and waits instead of starting another.
+        """
+        self.purge()
+        if generation_id is not None and generation_id in self._items:
+            raise KeyError(generation_id)
+        generation = Generation(user_id, session_id, generation_id)
+        self._items[generation.id] = generation
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        return generation
+
+    def get(self, generation_id: str, user_id: str) -> Optional[Generation]:
+        self.purge()
+        generation = self._items.get(generation_id)
+        if generation is None or generation.user_id != user_id:
+            return None
+        return generation
+
+    def exists(self, generation_id: str) -> bool:
+        return generation_id in self._items
+
+    def discard(self, generation_id: str):
+        self._items.pop(generation_id, None)
+
+    def purge(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            generation_id
+            for generation_id, generation in self._items.items()
+            if generation.done and generation.finished_at < cutoff
+        ]
+        for generation_id in expired:
+            del self._items[generation_id]
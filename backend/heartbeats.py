@@ -0,0 +1,154 @@
+"""
+Buffered ingestion for /api/status heartbeats.
+
+Heartbeats are collected in memory and written with one insert_many when the
+buffer reaches `max_size` or every `flush_interval` seconds, whichever comes
+first. Each flush also folds the batch into per-client rollups in
+`status_rollups` (count, first/last seen, and a count over the current rate
+window), which is what GET /api/status reads instead of the raw rows.
+
+Every heartbeat gets its _id before its first insert attempt and keeps it
+across retries. A duplicate-key error on a retry therefore means the row
+was already written by an attempt whose outcome was unknown, and it is
+counted as written rather than retried again. Rollups are updated only for
+rows written in the current flush.
+
+A batch being flushed stays in pending_summary() until its rollups are
+written, so GET /api/status never misses it in between.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(batch: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-client count and first/last timestamp of a batch of heartbeats."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for check in batch:
+        timestamp = check["timestamp"]
+        client = summary.get(check["client_name"])
+        if client is None:
+            summary[check["client_name"]] = {"count": 1, "first_seen": timestamp, "last_seen": timestamp}
+            continue
+        client["count"] += 1
+        client["first_seen"] = min(client["first_seen"], timestamp)
+        client["last_seen"] = max(client["last_seen"], timestamp)
+    return summary
+
+
+class HeartbeatBuffer:
+    def __init__(self, max_size: int = 500, flush_interval: float = 2.0, rate_window: float = 300):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.rate_window = rate_window
+        self.db = None
+        self._pending: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def start(self, db):
+        self.db = db
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def add(self, check: Dict[str, Any]):
+        check.setdefault("_id", ObjectId())
+        self._pending.append(check)
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+
+    def pending_summary(self) -> Dict[str, Dict[str, Any]]:
+        return summarize(self._in_flight + self._pending)
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending or self.db is None:
+                return
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                await self._write(batch)
+            finally:
+                self._in_flight = []
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        failed: List[Dict[str, Any]] = []
+        try:
+            await self.db.status_checks.insert_many(batch, ordered=False)
+            written = batch
+        except BulkWriteError as e:
+            # Unordered: everything not listed in writeErrors was written
+            logger.error(f"Heartbeat flush partly failed: {str(e)}")
+            failed_indexes = {
+                error["index"]
+                for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY
+            }
+            written = [check for i, check in enumerate(batch) if i not in failed_indexes]
+            failed = [check for i, check in enumerate(batch) if i in failed_indexes]
+        except Exception as e:
+            # Outcome unknown (e.g. AutoReconnect): retry all of it; the
+            # _ids make rows that did get written show up as duplicates
+            logger.error(f"Heartbeat flush failed: {str(e)}")
+            written, failed = [], batch
+        # Failed rows move back to _pending in the same step, so they are
+        # never counted twice
+        self._in_flight = written
+        if failed:
+            # Put them back, but never hold more than a few flushes' worth
+            self._pending[:0] = failed
+            del self._pending[: max(0, len(self._pending) - 10 * self.max_size)]
+        if not written:
+            return
+        try:
+            await self.db.status_rollups.bulk_write(self._rollup_updates(written), ordered=False)
+        except Exception as e:
+            logger.error(f"Heartbeat rollup update failed: {str(e)}")
+
+    def _rollup_updates(self, batch: List[Dict[str, Any]]) -> List[UpdateOne]:
+        window_cutoff = datetime.utcnow() - timedelta(seconds=self.rate_window)
+        updates = []
+        for client_name, client in summarize(batch).items():
+            # Pipeline update so the rate window is reset or extended atomically.
+            # All expressions see the document as it was before this update.
+            window_expired = {"$lt": ["$window_start", window_cutoff]}  # true when missing
+            updates.append(UpdateOne(
+                {"client_name": client_name},
+                [{"$set": {
+                    "count": {"$add": [{"$ifNull": ["$count", 0]}, client["count"]]},
+                    "first_seen": {"$min": ["$first_seen", client["first_seen"]]},
+                    "last_seen": {"$max": ["$last_seen", client["last_seen"]]},
+                    "window_start": {"$cond": [window_expired, client["first_seen"], "$window_start"]},
+                    "window_count": {"$cond": [
+                        window_expired,
+                        client["count"],
+                        {"$add": ["$window_count", client["count"]]},
+                    ]},
+                }}],
+                upsert=True,
+            ))
+        return updates
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Heartbeat flush failed: {str(e)}")
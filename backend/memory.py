@@ -0,0 +1,242 @@
+"""
+Relevance-based long-term memory for chat sessions.
+
+The chat prompt always carries the most recent turns. For longer sessions,
+earlier messages are embedded into a per-session index and the few most
+similar to the new message are added to the prompt as well, so the prompt
+stays a fixed size while relevant context from far back is not lost.
+
+Embedders are pluggable (see EMBEDDERS). The default HashingEmbedder needs
+no network or model download: it hashes character n-grams into a fixed-size
+vector, which works for Kurdish in either script as well as English. The
+hashing is vectorized with NumPy and, like the Gemini call, runs in a worker
+thread. A session's history is loaded and embedded in pages of at most
+`page_size` messages, so the event loop is never blocked by a long session.
+
+Search is brute-force cosine similarity with NumPy over at most
+`max_vectors` of a session's newest messages (older ones drop out of the
+index), which a single matrix product handles in well under a millisecond,
+so an ANN structure would only add overhead. Memory is bounded by
+max_sessions * max_vectors * dim * 4 bytes: 256 * 1000 * 512 * 4, about
+500 MiB, at the defaults with the hashing embedder. Short sessions only
+take what they use, since an index grows its buffer by doubling.
+"""
+
+import asyncio
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class Embedder(ABC):
+    """Turns texts into L2-normalized float32 vectors of size `dim`."""
+
+    dim: int
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder(Embedder):
+    """Signed feature hashing of character n-grams (offline, deterministic).
+
+    Each word is padded with spaces and every n-gram inside it is hashed with
+    a polynomial hash over its code points, computed for all positions at
+    once with uint64 arithmetic (wrapping is intended).
+    """
+
+    _BASE = np.uint64(0x100000001B3)
+    _MIX = np.uint64(0xFF51AFD7ED558CCD)
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _vector(self, text: str) -> np.ndarray:
+        normalized = unicodedata.normalize("NFKC", text).casefold()
+        words = normalized.split()
+        if not words:
+            return np.zeros(self.dim, dtype=np.float32)
+        # " w1 \0 w2 \0 ...": n-grams containing the \0 separator span two
+        # words and are dropped
+        joined = "\0".join(f" {word} " for word in words)
+        codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        separators = np.concatenate([[0], np.cumsum(codes == 0)])
+        buckets, signs = [], []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                break
+            digest = np.full(count, n, dtype=np.uint64)
+            for k in range(n):
+                digest = digest * self._BASE + codes[k:k + count]
+            digest ^= digest >> np.uint64(33)
+            digest *= self._MIX
+            digest ^= digest >> np.uint64(33)
+            within_word = separators[n:n + count] == separators[:count]
+            digest = digest[within_word]
+            # Low bits pick the bucket, the top bit the sign
+            buckets.append((digest % np.uint64(self.dim)).astype(np.intp))
+            signs.append(np.where(digest >> np.uint64(63), 1.0, -1.0))
+        vector = np.bincount(
+            np.concatenate(buckets), weights=np.concatenate(signs), minlength=self.dim
+        ).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._vector(text) for text in texts])
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+
+class GeminiEmbedder(Embedder):
+    """Gemini text embeddings; needs GOOGLE_API_KEY and network access."""
+
+    def __init__(self, get_genai: Callable, model: str = "models/text-embedding-004", dim: int = 768):
+        self.get_genai = get_genai
+        self.model = model
+        self.dim = dim
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # get_genai() may import the SDK, so it runs in the thread as well
+        result = self.get_genai().embed_content(model=self.model, content=texts)
+        vectors = np.asarray(result["embedding"], dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+
+EMBEDDERS: Dict[str, Callable[..., Embedder]] = {
+    "hashing": HashingEmbedder,
+    "gemini": GeminiEmbedder,
+}
+
+
+class SessionIndex:
+    """Embeddings of one session's newest messages, in timestamp order.
+
+    Vectors live in a preallocated buffer that doubles when full, up to
+    `max_vectors` rows; past that the oldest rows are dropped.
+    """
+
+    def __init__(self, dim: int, max_vectors: int = 1000):
+        self.max_vectors = max_vectors
+        self.ids: List[str] = []
+        self._buffer = np.zeros((0, dim), dtype=np.float32)
+        self.last_timestamp: Optional[datetime] = None
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._buffer[:len(self.ids)]
+
+    def add(self, messages: List[dict], vectors: np.ndarray):
+        if not messages:
+            return
+        self.last_timestamp = messages[-1]["timestamp"]
+        messages, vectors = messages[-self.max_vectors:], vectors[-self.max_vectors:]
+        size, added = len(self.ids), len(messages)
+        dropped = max(0, size + added - self.max_vectors)
+        if dropped:
+            self._buffer[:size - dropped] = self._buffer[dropped:size]
+            del self.ids[:dropped]
+            size -= dropped
+        if size + added > len(self._buffer):
+            capacity = min(self.max_vectors, max(size + added, 2 * len(self._buffer)))
+            buffer = np.zeros((capacity, self._buffer.shape[1]), dtype=np.float32)
+            buffer[:size] = self._buffer[:size]
+            self._buffer = buffer
+        self._buffer[size:size + added] = vectors
+        self.ids.extend(message["id"] for message in messages)
+
+    def search(self, query: np.ndarray, k: int, exclude: set, min_score: float) -> List[Tuple[str, float]]:
+        if not self.ids:
+            return []
+        scores = self.vectors @ query
+        results = []
+        for i in np.argsort(-scores):
+            if scores[i] < min_score or len(results) == k:
+                break
+            if self.ids[i] not in exclude:
+                results.append((self.ids[i], float(scores[i])))
+        return results
+
+
+class MemoryStore:
+    """LRU cache of per-session indexes, kept current from the message store.
+
+    `load_since(session_id, after, limit)` must return up to `limit` of the
+    session's messages (with id, content and timestamp) newer than `after`, in
+    timestamp order. It is called on every lookup, so an index built by this
+    worker also picks up messages written by other workers. Catching up on a
+    long session takes several pages of `page_size`, each embedded in one
+    embedder call.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        load_since: Callable[[str, Optional[datetime], int], Awaitable[List[dict]]],
+        max_sessions: int = 256,
+        page_size: int = 200,
+        max_vectors: int = 1000,
+    ):
+        self.embedder = embedder
+        self.load_since = load_since
+        self.max_sessions = max_sessions
+        self.page_size = page_size
+        self.max_vectors = max_vectors
+        self._indexes: "OrderedDict[str, SessionIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _index(self, session_id: str) -> SessionIndex:
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                index = SessionIndex(self.embedder.dim, self.max_vectors)
+                self._indexes[session_id] = index
+                while len(self._indexes) > self.max_sessions:
+                    evicted, _ = self._indexes.popitem(last=False)
+                    self._locks.pop(evicted, None)
+            self._indexes.move_to_end(session_id)
+            while True:
+                new_messages = await self.load_since(session_id, index.last_timestamp, self.page_size)
+                if new_messages:
+                    vectors = await self.embedder.embed([m["content"] for m in new_messages])
+                    index.add(new_messages, vectors)
+                if len(new_messages) < self.page_size:
+                    return index
+
+    async def relevant(
+        self,
+        session_id: str,
+        query: str,
+        k: int,
+        exclude_ids: set,
+        min_score: float = 0.0,
+    ) -> List[Tuple[str, float]]:
+        """Ids and scores of the k messages most similar to `query`."""
+        index = await self._index(session_id)
+        query_vector = (await self.embedder.embed([query]))[0]
+        return index.search(query_vector, k, exclude_ids, min_score)
+
+    def forget(self, session_id: str):
+        self._indexes.pop(session_id, None)
+        self._locks.pop(session_id, None)
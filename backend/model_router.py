@@ -0,0 +1,184 @@
+"""
+Per-request model selection for chat turns.
+
+A rules table maps simple features of the incoming message (length, whether
+it contains code, requested language) to an ordered chain of Gemini models.
+The first rule whose conditions all hold wins. The chain is then adjusted
+with what has been observed at runtime: a model that has failed
+`max_consecutive_failures` times in a row, or whose error rate is at least
+`max_error_rate` over `min_requests` or more requests, moves to the back
+until `error_cooldown` seconds after its last failure, and rules with
+"prefer": "fastest" order their models by observed time to first chunk. The
+caller tries the chain in order, falling back to the next model when one
+fails before producing output.
+
+DEFAULT_RULES send code and long prompts to DEFAULT_MODEL first and short
+questions to whichever Flash model is currently fastest.
+model_routes.example.json is a fuller table to start a MODEL_ROUTES from.
+
+Rules are JSON objects:
+
+    {"name": "quick",
+     "when": {"max_chars": 200, "has_code": false, "languages": ["en", "ku"]},
+     "models": ["gemini-2.0-flash-lite", "gemini-2.0-flash-exp"],
+     "prefer": "fastest"}
+
+Supported conditions are min_chars, max_chars, has_code and languages; a
+rule with an empty "when" matches everything.
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        "name": "code",
+        "when": {"has_code": True},
+        "models": [DEFAULT_MODEL, "gemini-2.0-flash"],
+    },
+    {
+        "name": "long",
+        "when": {"min_chars": 2000},
+        "models": [DEFAULT_MODEL, "gemini-2.0-flash"],
+    },
+    {
+        "name": "quick",
+        "when": {"max_chars": 200},
+        "models": ["gemini-2.0-flash-lite", "gemini-2.0-flash", DEFAULT_MODEL],
+        "prefer": "fastest",
+    },
+    {
+        "name": "default",
+        "when": {},
+        "models": [DEFAULT_MODEL, "gemini-2.0-flash"],
+    },
+]
+
+_code_re = re.compile(
+    r"```|^\s*(def|class|import|function|const|let|var|public|private|#include|SELECT|<\w+[^>]*>)\b"
+    r"|[;{]\s*$",
+    re.MULTILINE,
+)
+
+
+def has_code(text: str) -> bool:
+    return bool(_code_re.search(text))
+
+
+class ModelStats:
+    """Exponentially weighted time to first chunk and error rate of one model,
+    plus its current run of consecutive failures."""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.last_error_at: Optional[float] = None
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+        else:
+            self.consecutive_failures += 1
+            self.last_error_at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        rules: Optional[List[Dict[str, Any]]] = None,
+        fallback: Optional[List[str]] = None,
+        alpha: float = 0.2,
+        max_consecutive_failures: int = 3,
+        max_error_rate: float = 0.5,
+        min_requests: int = 20,
+        error_cooldown: float = 60,
+    ):
+        self.rules = rules or DEFAULT_RULES
+        self.fallback = fallback or [DEFAULT_MODEL]
+        self.alpha = alpha
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.error_cooldown = error_cooldown
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, rules_json: Optional[str], **options) -> "ModelRouter":
+        return cls(json.loads(rules_json) if rules_json else None, **options)
+
+    def _matches(self, when: Dict[str, Any], text: str, language: str, code: bool) -> bool:
+        if "min_chars" in when and len(text) < when["min_chars"]:
+            return False
+        if "max_chars" in when and len(text) > when["max_chars"]:
+            return False
+        if "has_code" in when and code != when["has_code"]:
+            return False
+        if "languages" in when and language not in when["languages"]:
+            return False
+        return True
+
+    def stats(self, model: str) -> ModelStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats(self.alpha)
+            return self._stats[model]
+
+    def is_healthy(self, model: str) -> bool:
+        stats = self.stats(model)
+        # The error rate only counts once there are enough requests behind it
+        failing = stats.consecutive_failures >= self.max_consecutive_failures or (
+            stats.requests >= self.min_requests and stats.error_rate >= self.max_error_rate
+        )
+        if not failing:
+            return True
+        # Failing models get retried once the cooldown since their last error
+        # passes; one more failure starts a new cooldown
+        return time.monotonic() - (stats.last_error_at or 0) > self.error_cooldown
+
+    def route(self, text: str, language: str = "en") -> Dict[str, Any]:
+        """Pick the rule for this message and return it with its model chain."""
+        code = has_code(text)
+        rule = next(
+            (rule for rule in self.rules if self._matches(rule.get("when", {}), text, language, code)),
+            {"name": "fallback", "models": []},
+        )
+        chain = list(dict.fromkeys(rule["models"]))
+        if rule.get("prefer") == "fastest":
+            # Unmeasured models go first so each one gets a latency sample
+            chain.sort(key=lambda model: self.stats(model).latency or 0.0)
+        chain += [model for model in self.fallback if model not in chain]
+
+        healthy = [model for model in chain if self.is_healthy(model)]
+        chain = healthy + [model for model in chain if model not in healthy]
+        return {"rule": rule["name"], "has_code": code, "models": chain}
+
+    def record(self, model: str, latency: Optional[float], ok: bool):
+        stats = self.stats(model)
+        with self._lock:
+            stats.record(latency, ok)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {model: stats.to_dict() for model, stats in self._stats.items()}
+        return {"rules": self.rules, "fallback": self.fallback, "models": models}
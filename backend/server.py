@@ -1,21 +1,36 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo.errors import OperationFailure
 import os
+import re
+import asyncio
+import zlib
+import orjson
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from contextlib import asynccontextmanager, nullcontext
 import json
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import hashlib
-import google.generativeai as genai
+from generations import Generation, GenerationStore
+from heartbeats import HeartbeatBuffer
+from memory import EMBEDDERS, GeminiEmbedder, MemoryStore
+from compression import CompressionMiddleware
+from model_router import DEFAULT_MODEL, ModelRouter
+from tracing import MongoCommandListener, Tracer, TracingMiddleware, install_log_correlation, make_exporter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -28,18 +43,166 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# MongoDB connection
+# MongoDB connection. The client is created and warmed in lifespan() so that
+# importing this module has no network side effects.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+READY_CHECK_TIMEOUT_SECONDS = float(os.environ.get('READY_CHECK_TIMEOUT_SECONDS', 2))
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+# Tracing. TRACE_EXPORTER is "none", "console" or "file" (JSON lines at
+# TRACE_FILE); TRACE_SAMPLE_RATE is the fraction of new traces exported.
+tracer = Tracer(
+    service_name=os.environ.get('TRACE_SERVICE_NAME', 'kurdcine-chat-api'),
+    exporter=make_exporter(
+        os.environ.get('TRACE_EXPORTER', 'none'),
+        os.environ.get('TRACE_FILE', str(ROOT_DIR / 'traces.jsonl')),
+    ),
+    sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 1.0)),
+)
 
-# Configure Google Gemini
+# Google Gemini. The SDK is slow to import, so it is loaded on first use, or
+# in the background right after startup when LLM_PREIMPORT is enabled.
 google_api_key = os.environ.get('GOOGLE_API_KEY')
-if google_api_key:
-    genai.configure(api_key=google_api_key)
+LLM_PREIMPORT = os.environ.get('LLM_PREIMPORT', '1') == '1'
+_genai = None
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        if google_api_key:
+            genai.configure(api_key=google_api_key)
+        _genai = genai
+    return _genai
+
+async def load_genai():
+    # The first import can take seconds; keep it off the event loop
+    if _genai is not None:
+        return _genai
+    return await asyncio.to_thread(get_genai)
+
+def preimport_genai():
+    try:
+        get_genai()
+    except Exception as e:
+        logger.warning(f"Gemini SDK pre-import failed: {str(e)}")
+
+# In-flight and recently finished replies, for clients that reconnect
+generation_store = GenerationStore(
+    max_entries=int(os.environ.get('GENERATION_STORE_MAX_ENTRIES', 1000)),
+    ttl_seconds=float(os.environ.get('GENERATION_TTL_SECONDS', 600)),
+)
+
+# Heartbeats from /api/status are written in batches. Raw rows expire after
+# STATUS_RETENTION_SECONDS; per-client rollups are kept.
+heartbeat_buffer = HeartbeatBuffer(
+    max_size=int(os.environ.get('HEARTBEAT_FLUSH_SIZE', 500)),
+    flush_interval=float(os.environ.get('HEARTBEAT_FLUSH_SECONDS', 2)),
+    rate_window=float(os.environ.get('HEARTBEAT_RATE_WINDOW_SECONDS', 300)),
+)
+STATUS_RETENTION_SECONDS = int(os.environ.get('STATUS_RETENTION_SECONDS', 7 * 24 * 3600))
+
+# Chat context: the last RECENT_CONTEXT_MESSAGES messages, plus up to
+# MEMORY_TOP_K earlier ones picked by similarity to the new message.
+# MEMORY_EMBEDDER is "hashing" (offline) or "gemini".
+RECENT_CONTEXT_MESSAGES = int(os.environ.get('RECENT_CONTEXT_MESSAGES', 10))
+MEMORY_ENABLED = os.environ.get('MEMORY_ENABLED', '1') == '1'
+MEMORY_TOP_K = int(os.environ.get('MEMORY_TOP_K', 4))
+MEMORY_MIN_SCORE = float(os.environ.get('MEMORY_MIN_SCORE', 0.2))
+MEMORY_MAX_CHARS = int(os.environ.get('MEMORY_MAX_CHARS', 1000))
+
+def make_embedder():
+    name = os.environ.get('MEMORY_EMBEDDER', 'hashing')
+    if name == "gemini":
+        return GeminiEmbedder(get_genai)
+    return EMBEDDERS[name]()
+
+# /api/chat/batch parallelism; requests may ask for less than the maximum
+BATCH_DEFAULT_CONCURRENCY = int(os.environ.get('BATCH_DEFAULT_CONCURRENCY', 4))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 16))
+
+# Incremental session sync: page size, and how long deletions are remembered
+SESSION_CHANGES_LIMIT = int(os.environ.get('SESSION_CHANGES_LIMIT', 200))
+SESSION_TOMBSTONE_TTL_SECONDS = int(os.environ.get('SESSION_TOMBSTONE_TTL_SECONDS', 30 * 24 * 3600))
+# A change sequence number that was allocated but not written within this
+# long is taken to belong to a crashed writer and no longer holds cursors back
+SESSION_CHANGE_PENDING_SECONDS = float(os.environ.get('SESSION_CHANGE_PENDING_SECONDS', 30))
+
+# Model routing. MODEL_ROUTES is a JSON rules table (see model_router.py and
+# model_routes.example.json); MODEL_FALLBACK a comma-separated chain tried
+# after a rule's own models.
+model_router = ModelRouter.from_json(
+    os.environ.get('MODEL_ROUTES'),
+    fallback=[m.strip() for m in os.environ.get('MODEL_FALLBACK', DEFAULT_MODEL).split(',') if m.strip()],
+    max_consecutive_failures=int(os.environ.get('MODEL_MAX_CONSECUTIVE_FAILURES', 3)),
+    max_error_rate=float(os.environ.get('MODEL_MAX_ERROR_RATE', 0.5)),
+    min_requests=int(os.environ.get('MODEL_MIN_REQUESTS', 20)),
+    error_cooldown=float(os.environ.get('MODEL_ERROR_COOLDOWN_SECONDS', 60)),
+)
+
+# Cold-start timings, reported by /api/health/live
+startup_timings: Dict[str, float] = {}
+app_ready = False
+# Readiness also waits for ensure_indexes(); if Mongo is down at boot it is
+# retried in the background every INDEX_RETRY_SECONDS until it succeeds
+INDEX_RETRY_SECONDS = float(os.environ.get('INDEX_RETRY_SECONDS', 5))
+indexes_ready = False
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, app_ready, indexes_ready
+    started = time.perf_counter()
+    startup_timings["import_seconds"] = round(started - IMPORT_STARTED, 4)
+
+    client = AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[MongoCommandListener(tracer)],
+    )
+    db = client[os.environ['DB_NAME']]
+    index_retry_task = None
+    try:
+        # Open the minimum pool up front instead of on the first requests
+        await asyncio.gather(
+            *(client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE)))
+        )
+        startup_timings["mongo_warmup_seconds"] = round(time.perf_counter() - started, 4)
+        await ensure_indexes()
+        indexes_ready = True
+    except Exception as e:
+        # Keep booting; /api/health/ready reports not ready until the
+        # indexes exist
+        logger.error(f"MongoDB warm-up failed: {str(e)}")
+        index_retry_task = asyncio.create_task(retry_ensure_indexes())
+
+    heartbeat_buffer.start(db)
+    if LLM_PREIMPORT:
+        asyncio.get_running_loop().run_in_executor(None, preimport_genai)
+
+    startup_timings["lifespan_seconds"] = round(time.perf_counter() - started, 4)
+    startup_timings["total_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 4)
+    logger.info(f"Startup complete: {startup_timings}")
+    app_ready = True
+    try:
+        yield
+    finally:
+        app_ready = False
+        if index_retry_task:
+            index_retry_task.cancel()
+        if backfill_task:
+            backfill_task.cancel()
+        await heartbeat_buffer.stop()
+        client.close()
+        tracer.exporter.shutdown()
 
 # Create the main app without a prefix
-app = FastAPI(title="KurdCine Chat API", version="1.0.0")
+app = FastAPI(title="KurdCine Chat API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -70,12 +233,26 @@ class UserResponse(BaseModel):
     is_admin: bool
     created_at: datetime
 
+DEFAULT_SESSION_TITLE = "New Chat"
+
 class ChatSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    title: str = "New Chat"
+    title: str = DEFAULT_SESSION_TITLE
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    change_seq: int = 0  # see session_change()
+    # Denormalized for the sidebar; see session_summary_update()
+    message_count: int = 0
+    last_message_preview: str = ""
+    last_role: Optional[str] = None
+
+class SessionChanges(BaseModel):
+    cursor: int
+    reset: bool  # true when `sessions` is the full list rather than a delta
+    has_more: bool
+    sessions: List[ChatSession]
+    deleted: List[str]
 
 class ChatMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -90,12 +267,27 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     language: Optional[str] = "en"
+    # Client-chosen id; resending with the same id reattaches to the
+    # original generation instead of starting a new one
+    generation_id: Optional[str] = Field(default=None, min_length=8, max_length=64)
 
 class ChatResponse(BaseModel):
     message: str
     session_id: str
     ai_response: str
     timestamp: datetime
+    generation_id: Optional[str] = None
+
+class BatchChatItem(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+    language: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(..., min_length=1, max_length=int(os.environ.get('BATCH_MAX_ITEMS', 200)))
+    session_id: Optional[str] = None
+    language: Optional[str] = "en"
+    concurrency: Optional[int] = Field(default=None, ge=1)
 
 class AdminPrompt(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -109,6 +301,22 @@ class AdminPromptCreate(BaseModel):
     name: str
     content: str
 
+class SearchHit(BaseModel):
+    message_id: str
+    session_id: str
+    role: str
+    timestamp: datetime
+    score: float
+    snippet: str
+    highlights: List[List[int]]  # [start, end) offsets into snippet
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    page: int
+    limit: int
+    results: List[SearchHit]
+
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
@@ -117,12 +325,91 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusSummary(BaseModel):
+    client_name: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+    rate_per_minute: float  # heartbeats per minute over the current rate window
+
+# Projections for list endpoints. Only the fields in the response model are
+# fetched, and Mongo's _id is dropped so the documents can be encoded as-is.
+def model_projection(model) -> Dict[str, int]:
+    projection = {name: 1 for name in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+def model_defaults(model) -> Dict[str, Any]:
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+CHAT_SESSION_PROJECTION = model_projection(ChatSession)
+CHAT_MESSAGE_PROJECTION = model_projection(ChatMessage)
+ADMIN_PROMPT_PROJECTION = model_projection(AdminPrompt)
+
+def fill_model_defaults(documents: List[Dict[str, Any]], model) -> List[Dict[str, Any]]:
+    """Give documents written before a field existed the model's default."""
+    defaults = model_defaults(model)
+    if defaults:
+        for document in documents:
+            for name, value in defaults.items():
+                document.setdefault(name, value)
+    return documents
+
+def fast_list_response(
+    documents: List[Dict[str, Any]], model, headers: Optional[Dict[str, str]] = None
+) -> ORJSONResponse:
+    """Serialize projected documents straight to JSON.
+
+    The documents were written from the same models, so building a model per
+    row and letting FastAPI validate the list again only costs time.
+    """
+    return ORJSONResponse(fill_model_defaults(documents, model), headers=headers)
+
+# Conditional GET. Validators are built from cheap, index-covered queries so a
+# 304 is answered without loading the list itself.
+def weak_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: the W/ prefix is ignored on both sides
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    # private + no-cache: browsers keep the copy but revalidate every time,
+    # and it is keyed per user since Authorization varies
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+# Export settings. Admin exports pause every ADMIN_EXPORT_PAUSE_EVERY documents
+# and only ADMIN_EXPORT_CONCURRENCY of them run at once, so a full backup
+# doesn't monopolize Mongo or the event loop.
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+EXPORT_CHUNK_BYTES = 64 * 1024
+ADMIN_EXPORT_PAUSE_EVERY = int(os.environ.get('ADMIN_EXPORT_PAUSE_EVERY', 1000))
+ADMIN_EXPORT_PAUSE_SECONDS = float(os.environ.get('ADMIN_EXPORT_PAUSE_SECONDS', 0.05))
+admin_export_slots = asyncio.Semaphore(int(os.environ.get('ADMIN_EXPORT_CONCURRENCY', 1)))
+
 # Utility functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with tracer.span("auth.verify_password"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with tracer.span("auth.hash_password"):
+        return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -161,6 +448,108 @@ async def get_current_admin_user(current_user: User = Depends(get_current_user))
         )
     return current_user
 
+SEARCH_SNIPPET_CHARS = 160
+_search_term_re = re.compile(r"\w+", re.UNICODE)
+
+def build_search_hit(message: Dict[str, Any], query: str) -> SearchHit:
+    """Cut a snippet around the first query term and mark every term in it.
+
+    Matching is case-insensitive on whole Unicode words, the same way the
+    text index (built with default_language "none") tokenizes content, so
+    Sorani and Kurmanji text is highlighted without any stemming.
+    """
+    content = message["content"]
+    terms = {term.casefold() for term in _search_term_re.findall(query)}
+    words = [m for m in _search_term_re.finditer(content) if m.group().casefold() in terms]
+
+    start = 0
+    if words and len(content) > SEARCH_SNIPPET_CHARS:
+        start = max(0, words[0].start() - SEARCH_SNIPPET_CHARS // 4)
+    end = min(len(content), start + SEARCH_SNIPPET_CHARS)
+    snippet = content[start:end]
+    highlights = [
+        [m.start() - start, m.end() - start]
+        for m in words
+        if m.start() >= start and m.end() <= end
+    ]
+    if start > 0:
+        snippet = "…" + snippet
+        highlights = [[a + 1, b + 1] for a, b in highlights]
+    if end < len(content):
+        snippet += "…"
+
+    return SearchHit(
+        message_id=message["id"],
+        session_id=message["session_id"],
+        role=message["role"],
+        timestamp=message["timestamp"],
+        score=message["score"],
+        snippet=snippet,
+        highlights=highlights,
+    )
+
+def ndjson_line(kind: str, document: Dict[str, Any]) -> bytes:
+    return orjson.dumps({"type": kind, **document}) + b"\n"
+
+class ExportThrottle:
+    """Yields to other requests every `every` documents when enabled."""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.count = 0
+
+    async def tick(self):
+        self.count += 1
+        if self.enabled and self.count % ADMIN_EXPORT_PAUSE_EVERY == 0:
+            await asyncio.sleep(ADMIN_EXPORT_PAUSE_SECONDS)
+
+async def export_sessions(session_query: Dict[str, Any], sort: str, throttle: ExportThrottle):
+    """Stream sessions matching the query, each followed by its messages."""
+    sessions = db.chat_sessions.find(
+        session_query, CHAT_SESSION_PROJECTION
+    ).sort(sort, 1).batch_size(EXPORT_BATCH_SIZE)
+    async for session in sessions:
+        yield ndjson_line("session", session)
+        await throttle.tick()
+        messages = db.chat_messages.find(
+            {"session_id": session["id"]}, CHAT_MESSAGE_PROJECTION
+        ).sort("timestamp", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for message in messages:
+            yield ndjson_line("message", message)
+            await throttle.tick()
+
+async def chunked(lines, size: int = EXPORT_CHUNK_BYTES):
+    buffer = bytearray()
+    async for line in lines:
+        buffer += line
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+async def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(lines, name: str, gzip: bool) -> StreamingResponse:
+    body = chunked(lines)
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    media_type = "application/x-ndjson"
+    if gzip:
+        body = gzipped(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # Authentication endpoints
 @api_router.post("/auth/register", response_model=UserResponse)
 async def register(user_data: UserCreate):
@@ -205,38 +594,112 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return UserResponse(**current_user.dict())
 
 # Chat endpoints
-@api_router.post("/chat/send", response_model=ChatResponse)
-async def send_message(chat_request: ChatRequest, current_user: User = Depends(get_current_user)):
+SESSION_TITLE_CHARS = 60
+SESSION_PREVIEW_CHARS = 120
+
+def shorten(text: str, limit: int) -> str:
+    text = " ".join(text.replace("```", " ").split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] or text[:limit]
+    return cut + "…"
+
+def auto_title(first_user_message: str) -> str:
+    for line in first_user_message.splitlines():
+        line = line.strip(" #>*`-")
+        if line:
+            return shorten(line, SESSION_TITLE_CHARS)
+    return DEFAULT_SESSION_TITLE
+
+def session_summary_update(
+    added_messages: int, last_message: Dict[str, Any], change_seq: int, user_message: str
+) -> List[Dict[str, Any]]:
+    # Folds a completed turn into the summary (the user message is counted
+    # with its reply), and titles a session still called DEFAULT_SESSION_TITLE
+    # after this turn's message. $literal keeps user text starting with "$"
+    # from being read as a field path.
+    return [{"$set": {
+        "updated_at": datetime.utcnow(),
+        "change_seq": change_seq,
+        "last_message_preview": {"$literal": shorten(last_message["content"], SESSION_PREVIEW_CHARS)},
+        "last_role": last_message["role"],
+        "message_count": {"$add": [{"$ifNull": ["$message_count", 0]}, added_messages]},
+        "title": {"$cond": [
+            {"$eq": [{"$ifNull": ["$title", DEFAULT_SESSION_TITLE]}, DEFAULT_SESSION_TITLE]},
+            {"$literal": auto_title(user_message)},
+            "$title",
+        ]},
+    }}]
+
+# Session change sequence, one counter per user. Sequences used to be global;
+# per-user counters start above the last global value so sessions stamped
+# before the switch still sort as older.
+legacy_change_seq: Optional[int] = None
+
+def change_counter_id(user_id: str) -> str:
+    return f"chat_sessions:{user_id}"
+
+async def legacy_change_seq_base() -> int:
+    global legacy_change_seq
+    if legacy_change_seq is None:
+        counter = await db.counters.find_one({"_id": "chat_sessions"}, {"seq": 1})
+        legacy_change_seq = counter["seq"] if counter else 0
+    return legacy_change_seq
+
+async def next_change_seq(user_id: str) -> int:
+    # Allocated and added to `pending` in one write (dropping stale entries);
+    # use session_change(), which removes it again
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=SESSION_CHANGE_PENDING_SECONDS)
+    base = await legacy_change_seq_base()
+    counter = await db.counters.find_one_and_update(
+        {"_id": change_counter_id(user_id)},
+        [
+            {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", base]}, 1]}}},
+            {"$set": {"pending": {"$concatArrays": [
+                {"$filter": {"input": {"$ifNull": ["$pending", []]}, "cond": {"$gt": ["$$this.at", stale]}}},
+                [{"seq": "$seq", "at": now}],
+            ]}}},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"]
+
+@asynccontextmanager
+async def session_change(user_id: str):
+    """change_seq for one write to a user's sessions; pending until the block exits"""
+    seq = await next_change_seq(user_id)
     try:
-        # Get or create session
-        session_id = chat_request.session_id
-        if not session_id:
-            session = ChatSession(user_id=current_user.id)
-            await db.chat_sessions.insert_one(session.dict())
-            session_id = session.id
-        else:
-            session = await db.chat_sessions.find_one({"id": session_id, "user_id": current_user.id})
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Save user message
-        user_message = ChatMessage(
-            session_id=session_id,
-            user_id=current_user.id,
-            content=chat_request.message,
-            role="user",
-            language=chat_request.language
-        )
-        await db.chat_messages.insert_one(user_message.dict())
-        
-        # Get chat history for context
-        messages = await db.chat_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(100)
-        
-        # Create system message with custom prompt
-        system_message = f"""You are KurdCine Chat AI, a helpful AI assistant designed specifically for Kurdish users and cinema enthusiasts. You are:
-        1. Multilingual - Respond in the user's language ({chat_request.language})
+        yield seq
+    finally:
+        await db.counters.update_one({"_id": change_counter_id(user_id)}, {"$pull": {"pending": {"seq": seq}}})
+
+def committed_change_seq(counter: Optional[Dict[str, Any]], now: datetime, floor: int = 0) -> int:
+    """Highest sequence number with no change still being written at or below it"""
+    if not counter or "seq" not in counter:
+        return floor
+    stale = now - timedelta(seconds=SESSION_CHANGE_PENDING_SECONDS)
+    pending = [entry["seq"] for entry in counter.get("pending", []) if entry["at"] > stale]
+    return min(pending) - 1 if pending else counter["seq"]
+
+async def expire_session_tombstones(user_id: str):
+    # Tombstones expire here rather than through a TTL index, so the
+    # counter's tombstone_horizon can record the newest one removed. It is
+    # raised before deleting; a cursor below it may have missed a deletion.
+    cutoff = datetime.utcnow() - timedelta(seconds=SESSION_TOMBSTONE_TTL_SECONDS)
+    newest = await db.session_tombstones.find_one(
+        {"user_id": user_id, "deleted_at": {"$lt": cutoff}}, {"_id": 0, "change_seq": 1}, sort=[("deleted_at", -1)]
+    )
+    if not newest:
+        return
+    await db.counters.update_one(
+        {"_id": change_counter_id(user_id)}, {"$max": {"tombstone_horizon": newest["change_seq"]}}, upsert=True
+    )
+    await db.session_tombstones.delete_many({"user_id": user_id, "change_seq": {"$lte": newest["change_seq"]}})
+
+SYSTEM_PROMPT_TEMPLATE = """You are KurdCine Chat AI, a helpful AI assistant designed specifically for Kurdish users and cinema enthusiasts. You are:
+        1. Multilingual - Respond in the user's language ({language})
         2. Code-aware - Format code blocks properly with syntax highlighting using markdown
         3. Helpful and professional
         4. Knowledgeable about Kurdish culture, history, current events, and cinema
@@ -252,80 +715,486 @@ async def send_message(chat_request: ChatRequest, current_user: User = Depends(g
         Be respectful and culturally sensitive.
         Show enthusiasm for Kurdish culture and cinema when relevant.
         """
-        
-        # Check if Google API key is configured
-        if not google_api_key:
-            raise HTTPException(status_code=500, detail="AI service not configured")
-        
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Build conversation history for context
-        conversation_history = []
-        conversation_history.append({"role": "user", "parts": [system_message]})
-        
-        # Add recent messages for context (last 10 messages)
-        recent_messages = messages[-10:] if len(messages) > 10 else messages
-        for msg in recent_messages[:-1]:  # Exclude the current message we just added
-            role = "user" if msg["role"] == "user" else "model"
-            conversation_history.append({"role": role, "parts": [msg["content"]]})
-        
-        # Add current message
-        conversation_history.append({"role": "user", "parts": [chat_request.message]})
-        
-        # Generate response
+
+AI_ERROR_RESPONSE = "I apologize, but I encountered an error while processing your request. Please try again."
+
+async def load_messages_since(session_id: str, after: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {"session_id": session_id}
+    if after is not None:
+        query["timestamp"] = {"$gt": after}
+    return await db.chat_messages.find(
+        query, {"_id": 0, "id": 1, "content": 1, "timestamp": 1}
+    ).sort("timestamp", 1).limit(limit).to_list(limit)
+
+session_memory = MemoryStore(
+    make_embedder(),
+    load_messages_since,
+    max_sessions=int(os.environ.get('MEMORY_MAX_SESSIONS', 256)),
+    page_size=int(os.environ.get('MEMORY_EMBED_PAGE_SIZE', 200)),
+    max_vectors=int(os.environ.get('MEMORY_MAX_VECTORS_PER_SESSION', 1000)),
+)
+
+async def recall_earlier_messages(session_id: str, query: str, recent_ids: set) -> List[Dict[str, Any]]:
+    """Earlier messages of the session most relevant to `query`, oldest first"""
+    try:
+        hits = await session_memory.relevant(
+            session_id, query, MEMORY_TOP_K, exclude_ids=recent_ids, min_score=MEMORY_MIN_SCORE
+        )
+    except Exception as e:
+        logging.error(f"Memory recall failed: {str(e)}")
+        return []
+    if not hits:
+        return []
+    recalled = await db.chat_messages.find(
+        {"id": {"$in": [message_id for message_id, _ in hits]}},
+        {"_id": 0, "role": 1, "content": 1, "timestamp": 1},
+    ).to_list(len(hits))
+    return sorted(recalled, key=lambda message: message["timestamp"])
+
+async def build_conversation(session_id: str, chat_request: ChatRequest) -> List[Dict[str, Any]]:
+    # Get the most recent messages for context, including the one just saved
+    recent_messages = await db.chat_messages.find(
+        {"session_id": session_id}, {"_id": 0, "id": 1, "role": 1, "content": 1}
+    ).sort("timestamp", -1).limit(RECENT_CONTEXT_MESSAGES).to_list(RECENT_CONTEXT_MESSAGES)
+    recent_messages.reverse()
+    
+    # Longer sessions also get the most relevant earlier messages
+    system_message = SYSTEM_PROMPT_TEMPLATE.format(language=chat_request.language)
+    if MEMORY_ENABLED and len(recent_messages) == RECENT_CONTEXT_MESSAGES:
+        recalled = await recall_earlier_messages(
+            session_id, chat_request.message, {msg["id"] for msg in recent_messages}
+        )
+        if recalled:
+            lines = [
+                f"[{msg['role']}] {msg['content'][:MEMORY_MAX_CHARS]}"
+                for msg in recalled
+            ]
+            system_message += "\n\nRelevant earlier messages from this conversation:\n" + "\n".join(lines)
+    
+    # Build conversation history for context
+    conversation_history = []
+    conversation_history.append({"role": "user", "parts": [system_message]})
+    for msg in recent_messages[:-1]:  # Exclude the current message we just added
+        role = "user" if msg["role"] == "user" else "model"
+        conversation_history.append({"role": role, "parts": [msg["content"]]})
+    
+    # Add current message
+    conversation_history.append({"role": "user", "parts": [chat_request.message]})
+    return conversation_history
+
+async def generate_with_fallback(generation: Generation, conversation_history, models: List[str], span):
+    """Stream from the first model in the chain that works.
+
+    A model that fails before producing any output is recorded as an error
+    and the next one is tried; once output has been streamed there is no
+    switching, since followers may already have read it. A blocked prompt or
+    reply (the SDK's Blocked/StopCandidate exceptions, or the ValueError
+    chunk.text raises for a chunk without text) says nothing about the
+    model's health: it is not recorded, and the chain stops there.
+    """
+    genai = await load_genai()
+    blocked = (ValueError, genai.types.BlockedPromptException, genai.types.StopCandidateException)
+    for model_name in models:
+        span.set_attribute("llm.model", model_name)
+        started = time.perf_counter()
+        first_chunk_at = None
         try:
-            response = model.generate_content(conversation_history)
-            ai_response = response.text
+            model = genai.GenerativeModel(model_name)
+            response = await model.generate_content_async(conversation_history, stream=True)
+            async for chunk in response:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    span.set_attribute("llm.time_to_first_chunk_ms", round((first_chunk_at - started) * 1000, 1))
+                await generation.append(chunk.text)
+            latency = (first_chunk_at or time.perf_counter()) - started
+            model_router.record(model_name, latency, ok=True)
+            return
+        except blocked as e:
+            logging.warning(f"Gemini response blocked ({model_name}): {str(e)}")
+            span.record_exception(e)
+            if generation.length:
+                return
+            break
         except Exception as e:
-            logging.error(f"Gemini API error: {str(e)}")
-            ai_response = "I apologize, but I encountered an error while processing your request. Please try again."
+            model_router.record(model_name, None, ok=False)
+            logging.error(f"Gemini API error ({model_name}): {str(e)}")
+            if generation.length:
+                # Keep whatever was already streamed; followers may have read it
+                span.record_exception(e)
+                return
+    span.status = "ERROR"
+    await generation.append(AI_ERROR_RESPONSE)
+
+async def run_generation(generation: Generation, chat_request: ChatRequest):
+    """Produce, buffer and persist the assistant reply for one chat turn.
+
+    Runs as its own task so the reply is completed and saved even if the
+    client that asked for it has gone away.
+    """
+    try:
+        with tracer.span("chat.context", session_id=generation.session_id) as span:
+            conversation_history = await build_conversation(generation.session_id, chat_request)
+            span.set_attribute("chat.context_messages", len(conversation_history))
+        route = model_router.route(chat_request.message, chat_request.language)
         
-        # Save AI response
-        ai_message = ChatMessage(
+        # Generate response, buffering chunks for anyone following along
+        with tracer.span("llm.generate", **{"llm.route": route["rule"]}) as span:
+            await generate_with_fallback(generation, conversation_history, route["models"], span)
+            span.set_attribute("llm.response_chars", generation.length)
+        
+        with tracer.span("chat.persist"):
+            # Save AI response
+            ai_message = ChatMessage(
+                session_id=generation.session_id,
+                user_id=generation.user_id,
+                content=generation.text,
+                role="assistant",
+                language=chat_request.language
+            )
+            await db.chat_messages.insert_one(ai_message.dict())
+            
+            # Update session: timestamps, sync sequence and sidebar summary
+            # for the whole turn (user message + reply) in one write
+            async with session_change(generation.user_id) as change_seq:
+                await db.chat_sessions.update_one(
+                    {"id": generation.session_id},
+                    session_summary_update(2, ai_message.dict(), change_seq, chat_request.message),
+                )
+        await generation.finish(message_id=ai_message.id)
+    except Exception as e:
+        logging.error(f"Generation {generation.id} failed: {str(e)}")
+        await generation.finish(error="Chat service error")
+
+async def generation_response(generation: Generation, chat_request: ChatRequest) -> ChatResponse:
+    # Waits on the generation rather than its task, so a cancelled request
+    # doesn't cancel the generation, and a resend can wait on one whose
+    # task hasn't been started yet
+    await generation.wait()
+    if generation.error:
+        raise HTTPException(status_code=500, detail=generation.error)
+    return ChatResponse(
+        message=chat_request.message,
+        session_id=generation.session_id,
+        ai_response=generation.text,
+        timestamp=datetime.utcnow(),
+        generation_id=generation.id
+    )
+
+async def start_chat_turn(
+    chat_request: ChatRequest, user_id: str, session_checked: bool = False, register: bool = True
+) -> Generation:
+    """Save the user's message and start generating the reply in the background.
+
+    With register=False (batch items) the generation stays out of
+    generation_store, so it can't be reattached to but doesn't push other
+    users' generations out of the store either.
+    """
+    if register:
+        # Reserve the generation id before the first await, so a resend that
+        # arrives meanwhile reattaches to this turn instead of starting another
+        generation = generation_store.create(user_id, chat_request.session_id, chat_request.generation_id)
+    else:
+        generation = Generation(user_id, chat_request.session_id)
+    try:
+        # Get or create session
+        session_id = chat_request.session_id
+        if not session_id:
+            async with session_change(user_id) as change_seq:
+                session = ChatSession(
+                    user_id=user_id,
+                    title=auto_title(chat_request.message),
+                    change_seq=change_seq,
+                )
+                await db.chat_sessions.insert_one(session.dict())
+            session_id = session.id
+        elif not session_checked:
+            session = await db.chat_sessions.find_one({"id": session_id, "user_id": user_id})
+            if not session:
+                raise HTTPException(status_code=404, detail="Session not found")
+        
+        # Save user message
+        user_message = ChatMessage(
             session_id=session_id,
-            user_id=current_user.id,
-            content=ai_response,
-            role="assistant",
+            user_id=user_id,
+            content=chat_request.message,
+            role="user",
             language=chat_request.language
         )
-        await db.chat_messages.insert_one(ai_message.dict())
+        await db.chat_messages.insert_one(user_message.dict())
+    except BaseException as e:
+        # Nothing was started; release the id so the client can retry it
+        if register:
+            generation_store.discard(generation.id)
+        await generation.finish(error=e.detail if isinstance(e, HTTPException) else "Chat service error")
+        raise
+    
+    generation.session_id = session_id
+    generation.task = asyncio.create_task(run_generation(generation, chat_request))
+    return generation
+
+@api_router.post("/chat/send", response_model=ChatResponse)
+async def send_message(chat_request: ChatRequest, current_user: User = Depends(get_current_user)):
+    try:
+        # A resend of a request we already have a generation for reattaches
+        # to it instead of generating (and paying for) the answer again
+        if chat_request.generation_id:
+            generation = generation_store.get(chat_request.generation_id, current_user.id)
+            if generation:
+                return await generation_response(generation, chat_request)
+            # Someone else's id: answer as if it didn't exist rather than
+            # confirming that it does
+            if generation_store.exists(chat_request.generation_id):
+                raise HTTPException(status_code=404, detail="Generation not found")
         
-        # Update session
-        await db.chat_sessions.update_one(
-            {"id": session_id},
-            {"$set": {"updated_at": datetime.utcnow()}}
-        )
+        # Check if Google API key is configured
+        if not google_api_key:
+            raise HTTPException(status_code=500, detail="AI service not configured")
         
-        return ChatResponse(
-            message=chat_request.message,
-            session_id=session_id,
-            ai_response=ai_response,
-            timestamp=datetime.utcnow()
-        )
+        generation = await start_chat_turn(chat_request, current_user.id)
+        return await generation_response(generation, chat_request)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail="Chat service error")
 
+@api_router.post("/chat/batch")
+async def send_batch(batch_request: BatchChatRequest, current_user: User = Depends(get_current_user)):
+    """Run many prompts with bounded parallelism, streaming results as they finish.
+
+    Each NDJSON line carries the item's index plus either the ChatResponse
+    fields or an "error" and "status_code". Items without a session_id use the
+    batch's session_id, or get a new session each when that is unset too.
+    Items that share a session run one at a time in item order, since each
+    turn's context is the session's history up to its own message; only
+    items in different sessions run in parallel.
+    """
+    if not google_api_key:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+
+    # Check session ownership once per distinct session, not once per item
+    requested_sessions = {
+        item.session_id or batch_request.session_id
+        for item in batch_request.items
+    } - {None}
+    owned_sessions = set()
+    if requested_sessions:
+        owned = await db.chat_sessions.find(
+            {"id": {"$in": list(requested_sessions)}, "user_id": current_user.id}, {"_id": 0, "id": 1}
+        ).to_list(len(requested_sessions))
+        owned_sessions = {session["id"] for session in owned}
+
+    concurrency = min(batch_request.concurrency or BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    slots = asyncio.Semaphore(concurrency)
+    session_locks = {session_id: asyncio.Lock() for session_id in owned_sessions}
+
+    async def run_item(index: int, item: BatchChatItem) -> Dict[str, Any]:
+        chat_request = ChatRequest(
+            message=item.message,
+            session_id=item.session_id or batch_request.session_id,
+            language=item.language or batch_request.language,
+        )
+        if chat_request.session_id and chat_request.session_id not in owned_sessions:
+            return {"index": index, "error": "Session not found", "status_code": 404}
+        # Take the session's turn before a slot, so items queued behind
+        # another item of their session don't hold slots other sessions need
+        session_lock = session_locks.get(chat_request.session_id) or nullcontext()
+        async with session_lock, slots:
+            try:
+                generation = await start_chat_turn(
+                    chat_request, current_user.id, session_checked=True, register=False
+                )
+                response = await generation_response(generation, chat_request)
+                # Batch generations can't be followed, so no generation_id
+                return {"index": index, **response.dict(exclude={"generation_id"})}
+            except HTTPException as e:
+                return {"index": index, "error": e.detail, "status_code": e.status_code}
+            except Exception as e:
+                logging.error(f"Batch item {index} failed: {str(e)}")
+                return {"index": index, "error": "Chat service error", "status_code": 500}
+
+    async def results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(batch_request.items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield orjson.dumps(await finished) + b"\n"
+        finally:
+            # Client went away: don't start the items still waiting for a slot
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@api_router.get("/chat/generations/{generation_id}")
+async def follow_generation(
+    generation_id: str,
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+):
+    """Reattach to a generation: already generated text, then the live remainder.
+
+    Streams NDJSON lines of {"delta": ...} followed by a final line with
+    "done", the persisted "message_id" and any "error". `offset` skips text
+    the client already received.
+    """
+    generation = generation_store.get(generation_id, current_user.id)
+    if not generation:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+
+    async def events():
+        async for text in generation.follow(offset):
+            yield orjson.dumps({"delta": text}) + b"\n"
+        yield orjson.dumps({
+            "done": True,
+            "generation_id": generation.id,
+            "session_id": generation.session_id,
+            "message_id": generation.message_id,
+            "error": generation.error,
+        }) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @api_router.get("/chat/sessions", response_model=List[ChatSession])
-async def get_chat_sessions(current_user: User = Depends(get_current_user)):
+async def get_chat_sessions(request: Request, current_user: User = Depends(get_current_user)):
+    # Every session write stamps a new change_seq (including summary
+    # backfills, which leave updated_at alone) and any delete changes the count
+    session_count = await db.chat_sessions.count_documents({"user_id": current_user.id})
+    latest = await db.chat_sessions.find_one(
+        {"user_id": current_user.id}, {"_id": 0, "change_seq": 1}, sort=[("change_seq", -1)]
+    )
+    etag = weak_etag(current_user.id, session_count, latest.get("change_seq") if latest else None)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    sessions = await db.chat_sessions.find(
+        {"user_id": current_user.id}, CHAT_SESSION_PROJECTION
+    ).sort("updated_at", -1).to_list(100)
+    return fast_list_response(sessions, ChatSession, headers=cache_headers(etag))
+
+async def full_session_list(user_id: str, cursor: int) -> ORJSONResponse:
     sessions = await db.chat_sessions.find(
-        {"user_id": current_user.id}
+        {"user_id": user_id}, CHAT_SESSION_PROJECTION
     ).sort("updated_at", -1).to_list(100)
-    return [ChatSession(**session) for session in sessions]
+    return ORJSONResponse({
+        "cursor": cursor,
+        "reset": True,
+        "has_more": False,
+        "sessions": fill_model_defaults(sessions, ChatSession),
+        "deleted": [],
+    })
+
+@api_router.get("/chat/sessions/changes", response_model=SessionChanges)
+async def get_session_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(SESSION_CHANGES_LIMIT, ge=1, le=SESSION_CHANGES_LIMIT),
+    current_user: User = Depends(get_current_user),
+):
+    """Sessions created, updated or deleted after the `since` cursor.
+
+    since=0 returns the full list (reset=true) and a cursor to continue from,
+    as does a cursor older than the tombstones still kept.
+    Pass the returned cursor back on the next call; while has_more is true
+    there are further changes to fetch right away.
+    """
+    # Read the bound first. Nothing at or below it is still being written,
+    # and anything written later gets a higher number, so a cursor at or
+    # below it never skips a change
+    counter_id = change_counter_id(current_user.id)
+    counter = await db.counters.find_one({"_id": counter_id})
+    committed = committed_change_seq(counter, datetime.utcnow(), await legacy_change_seq_base())
+    # Tombstones up to the horizon are gone, so an older cursor starts over
+    if since == 0 or since < (counter or {}).get("tombstone_horizon", 0):
+        return await full_session_list(current_user.id, committed)
+
+    changed_query = {"user_id": current_user.id, "change_seq": {"$gt": since, "$lte": committed}}
+    sessions = await db.chat_sessions.find(
+        changed_query, CHAT_SESSION_PROJECTION
+    ).sort("change_seq", 1).limit(limit + 1).to_list(limit + 1)
+    tombstones = await db.session_tombstones.find(
+        changed_query, {"_id": 0, "id": 1, "change_seq": 1}
+    ).sort("change_seq", 1).limit(limit + 1).to_list(limit + 1)
+    # A concurrent expire_session_tombstones() raises the horizon before it
+    # deletes, so checking again catches tombstones removed under this read
+    counter = await db.counters.find_one({"_id": counter_id}, {"_id": 0, "tombstone_horizon": 1})
+    if since < (counter or {}).get("tombstone_horizon", 0):
+        return await full_session_list(current_user.id, committed)
+
+    # Merge both in sequence order and cut at `limit`, so the cursor never
+    # skips past a change that wasn't returned
+    changes = sorted(
+        [(session["change_seq"], session, False) for session in sessions]
+        + [(tombstone["change_seq"], tombstone, True) for tombstone in tombstones],
+        key=lambda change: change[0],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    changed_sessions = [doc for _, doc, deleted in changes if not deleted]
+    return ORJSONResponse({
+        "cursor": changes[-1][0] if changes else since,
+        "reset": False,
+        "has_more": has_more,
+        "sessions": fill_model_defaults(changed_sessions, ChatSession),
+        "deleted": [doc["id"] for _, doc, deleted in changes if deleted],
+    })
 
 @api_router.get("/chat/sessions/{session_id}/messages", response_model=List[ChatMessage])
-async def get_chat_messages(session_id: str, current_user: User = Depends(get_current_user)):
+async def get_chat_messages(session_id: str, request: Request, current_user: User = Depends(get_current_user)):
     # Verify session belongs to user
     session = await db.chat_sessions.find_one({"id": session_id, "user_id": current_user.id})
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    # The user's message is saved before updated_at moves, so count too
+    message_count = await db.chat_messages.count_documents({"session_id": session_id})
+    etag = weak_etag(current_user.id, session_id, session["updated_at"], message_count)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
     messages = await db.chat_messages.find(
-        {"session_id": session_id}
+        {"session_id": session_id}, CHAT_MESSAGE_PROJECTION
     ).sort("timestamp", 1).to_list(1000)
-    return [ChatMessage(**message) for message in messages]
+    return fast_list_response(messages, ChatMessage, headers=cache_headers(etag))
+
+@api_router.get("/chat/search", response_model=SearchResponse)
+async def search_chat_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+):
+    # The text index is prefixed with user_id, so scoping to the user is an
+    # index bound rather than a filter over every user's messages
+    query = {"user_id": current_user.id, "$text": {"$search": q}}
+    total = await db.chat_messages.count_documents(query)
+    messages = await db.chat_messages.find(
+        query,
+        {
+            "_id": 0,
+            "id": 1,
+            "session_id": 1,
+            "role": 1,
+            "content": 1,
+            "timestamp": 1,
+            "score": {"$meta": "textScore"},
+        },
+    ).sort(
+        [("score", {"$meta": "textScore"}), ("timestamp", DESCENDING)]
+    ).skip((page - 1) * limit).limit(limit).to_list(limit)
+
+    return SearchResponse(
+        query=q,
+        total=total,
+        page=page,
+        limit=limit,
+        results=[build_search_hit(message, q) for message in messages],
+    )
+
+@api_router.get("/chat/export")
+async def export_chat_history(gzip: bool = False, current_user: User = Depends(get_current_user)):
+    """Stream the user's sessions and messages as NDJSON, one document per line"""
+    lines = export_sessions({"user_id": current_user.id}, "created_at", ExportThrottle(enabled=False))
+    return export_response(lines, "kurdcine-chat-export", gzip)
 
 @api_router.delete("/chat/sessions/{session_id}")
 async def delete_chat_session(session_id: str, current_user: User = Depends(get_current_user)):
@@ -334,9 +1203,18 @@ async def delete_chat_session(session_id: str, current_user: User = Depends(get_
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Delete messages and session
+    # Delete messages and session, leaving a tombstone for incremental sync
     await db.chat_messages.delete_many({"session_id": session_id})
     await db.chat_sessions.delete_one({"id": session_id})
+    async with session_change(current_user.id) as change_seq:
+        await db.session_tombstones.insert_one({
+            "id": session_id,
+            "user_id": current_user.id,
+            "change_seq": change_seq,
+            "deleted_at": datetime.utcnow(),
+        })
+    await expire_session_tombstones(current_user.id)
+    session_memory.forget(session_id)
     
     return {"message": "Session deleted successfully"}
 
@@ -361,18 +1239,18 @@ async def create_admin_user(user_id: str, current_user: User = Depends(get_curre
 
 @api_router.get("/admin/analytics")
 async def get_analytics(current_user: User = Depends(get_current_admin_user)):
-    # Get user count
-    user_count = await db.users.count_documents({})
-    
-    # Get chat session count
-    session_count = await db.chat_sessions.count_documents({})
-    
-    # Get message count
-    message_count = await db.chat_messages.count_documents({})
+    # Collection counts from metadata; count_documents({}) scans every document
+    user_count = await db.users.estimated_document_count()
+    session_count = await db.chat_sessions.estimated_document_count()
+    message_count = await db.chat_messages.estimated_document_count()
     
     # Get recent activity
-    recent_sessions = await db.chat_sessions.find().sort("updated_at", -1).limit(10).to_list(10)
-    recent_users = await db.users.find().sort("created_at", -1).limit(10).to_list(10)
+    recent_sessions = await db.chat_sessions.find(
+        {}, CHAT_SESSION_PROJECTION
+    ).sort("updated_at", -1).limit(10).to_list(10)
+    recent_users = await db.users.find(
+        {}, {"_id": 0, "password_hash": 0}
+    ).sort("created_at", -1).limit(10).to_list(10)
     
     return {
         "user_count": user_count,
@@ -382,6 +1260,11 @@ async def get_analytics(current_user: User = Depends(get_current_admin_user)):
         "recent_users": recent_users
     }
 
+@api_router.get("/admin/models")
+async def get_model_routing(current_user: User = Depends(get_current_admin_user)):
+    """Routing rules and the latency / error rates observed per model"""
+    return model_router.snapshot()
+
 @api_router.post("/admin/prompts", response_model=AdminPrompt)
 async def create_admin_prompt(prompt_data: AdminPromptCreate, current_user: User = Depends(get_current_admin_user)):
     prompt = AdminPrompt(
@@ -394,8 +1277,10 @@ async def create_admin_prompt(prompt_data: AdminPromptCreate, current_user: User
 
 @api_router.get("/admin/prompts", response_model=List[AdminPrompt])
 async def get_admin_prompts(current_user: User = Depends(get_current_admin_user)):
-    prompts = await db.admin_prompts.find().sort("created_at", -1).to_list(100)
-    return [AdminPrompt(**prompt) for prompt in prompts]
+    prompts = await db.admin_prompts.find(
+        {}, ADMIN_PROMPT_PROJECTION
+    ).sort("created_at", -1).to_list(100)
+    return fast_list_response(prompts, AdminPrompt)
 
 @api_router.put("/admin/prompts/{prompt_id}")
 async def update_admin_prompt(prompt_id: str, prompt_data: AdminPromptCreate, current_user: User = Depends(get_current_admin_user)):
@@ -413,6 +1298,130 @@ async def delete_admin_prompt(prompt_id: str, current_user: User = Depends(get_c
     await db.admin_prompts.delete_one({"id": prompt_id})
     return {"message": "Prompt deleted successfully"}
 
+async def export_everything():
+    async with admin_export_slots:
+        throttle = ExportThrottle(enabled=True)
+        users = db.users.find({}, {"_id": 0, "password_hash": 0}).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for user in users:
+            yield ndjson_line("user", user)
+            await throttle.tick()
+        prompts = db.admin_prompts.find({}, ADMIN_PROMPT_PROJECTION).sort("created_at", 1)
+        async for prompt in prompts:
+            yield ndjson_line("admin_prompt", prompt)
+        # _id order is insertion order and needs no extra index
+        async for line in export_sessions({}, "_id", throttle):
+            yield line
+
+@api_router.get("/admin/export")
+async def export_all_data(gzip: bool = True, current_user: User = Depends(get_current_admin_user)):
+    """Full NDJSON backup of users, prompts, sessions and messages"""
+    return export_response(export_everything(), "kurdcine-backup", gzip)
+
+# Health endpoints
+@api_router.get("/health/live")
+async def liveness():
+    return {
+        "status": "ok",
+        "uptime_seconds": round(time.perf_counter() - IMPORT_STARTED, 3),
+        "startup": startup_timings,
+    }
+
+@api_router.get("/health/ready")
+async def readiness():
+    checks: Dict[str, Any] = {"llm_configured": bool(google_api_key), "indexes": indexes_ready}
+    ready = app_ready and indexes_ready
+    if app_ready:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(db.command("ping"), READY_CHECK_TIMEOUT_SECONDS)
+            checks["db"] = "ok"
+        except Exception as e:
+            checks["db"] = f"unreachable: {type(e).__name__}"
+            ready = False
+        checks["db_latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return ORJSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": checks},
+        status_code=200 if ready else 503,
+    )
+
+# Session summary backfill, for sessions written before summaries existed.
+# A session that keeps changing under it is retried BACKFILL_ATTEMPTS times.
+backfill_status: Dict[str, Any] = {"running": False, "updated": 0, "scanned": 0, "error": None}
+backfill_task: Optional[asyncio.Task] = None
+BACKFILL_ATTEMPTS = 3
+
+async def backfill_session_summaries():
+    """Recompute message_count, preview, last role and auto title per session"""
+    # One session at a time, pausing like the admin export. updated_at is left
+    # alone so the sidebar order doesn't change; clients pick up the change_seq
+    backfill_status.update(running=True, updated=0, scanned=0, error=None, started_at=datetime.utcnow())
+    try:
+        session_ids = db.chat_sessions.find({}, {"_id": 0, "id": 1}).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for session in session_ids:
+            backfill_status["scanned"] += 1
+            for _ in range(BACKFILL_ATTEMPTS):
+                if await backfill_session_summary(session["id"]):
+                    break
+            else:
+                logger.warning(f"Session {session['id']} kept changing; summary not backfilled")
+            if backfill_status["scanned"] % EXPORT_BATCH_SIZE == 0:
+                await asyncio.sleep(ADMIN_EXPORT_PAUSE_SECONDS)
+    except Exception as e:
+        logger.error(f"Session summary backfill failed: {str(e)}")
+        backfill_status["error"] = str(e)
+    finally:
+        backfill_status["running"] = False
+        backfill_status["finished_at"] = datetime.utcnow()
+
+async def backfill_session_summary(session_id: str) -> bool:
+    """Recompute one session's summary; False if the session changed meanwhile"""
+    # Only messages up to updated_at are counted (a turn in flight adds its
+    # own), and the write is guarded on the change_seq read here
+    session = await db.chat_sessions.find_one(
+        {"id": session_id}, {"_id": 0, "user_id": 1, "title": 1, "updated_at": 1, "change_seq": 1}
+    )
+    if not session:
+        return True
+    written = {"session_id": session_id, "timestamp": {"$lte": session["updated_at"]}}
+    count = await db.chat_messages.count_documents(written)
+    if not count:
+        return True
+    last = await db.chat_messages.find_one(
+        written, {"_id": 0, "content": 1, "role": 1}, sort=[("timestamp", -1)]
+    )
+    summary = {
+        "message_count": count,
+        "last_message_preview": shorten(last["content"], SESSION_PREVIEW_CHARS),
+        "last_role": last["role"],
+    }
+    if session.get("title", DEFAULT_SESSION_TITLE) == DEFAULT_SESSION_TITLE:
+        first_user = await db.chat_messages.find_one(
+            {"session_id": session_id, "role": "user"}, {"_id": 0, "content": 1}, sort=[("timestamp", 1)]
+        )
+        if first_user:
+            summary["title"] = auto_title(first_user["content"])
+    async with session_change(session["user_id"]) as change_seq:
+        # None also matches sessions written before change_seq existed
+        result = await db.chat_sessions.update_one(
+            {"id": session_id, "change_seq": session.get("change_seq")},
+            {"$set": {**summary, "change_seq": change_seq}},
+        )
+    if result.matched_count:
+        backfill_status["updated"] += 1
+    return bool(result.matched_count)
+
+@api_router.post("/admin/backfill/session-summaries", status_code=202)
+async def start_session_summary_backfill(current_user: User = Depends(get_current_admin_user)):
+    global backfill_task
+    if not backfill_status["running"]:
+        backfill_status["running"] = True
+        backfill_task = asyncio.create_task(backfill_session_summaries())
+    return backfill_status
+
+@api_router.get("/admin/backfill/session-summaries")
+async def get_session_summary_backfill(current_user: User = Depends(get_current_admin_user)):
+    return backfill_status
+
 # Legacy endpoints
 @api_router.get("/")
 async def root():
@@ -422,13 +1431,44 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await heartbeat_buffer.add(status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
+@api_router.get("/status", response_model=List[StatusSummary])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+    """Per-client heartbeat rollups, including heartbeats not yet flushed"""
+    rollups = await db.status_rollups.find({}, {"_id": 0}).sort("client_name", 1).to_list(1000)
+    pending = heartbeat_buffer.pending_summary()
+    now = datetime.utcnow()
+    window_cutoff = now - timedelta(seconds=heartbeat_buffer.rate_window)
+
+    summaries = []
+    for rollup in rollups:
+        window_start = rollup.get("window_start") or rollup["first_seen"]
+        window_count = rollup.get("window_count", 0)
+        if window_start < window_cutoff:
+            window_start, window_count = now, 0
+        extra = pending.pop(rollup["client_name"], None)
+        if extra:
+            rollup["count"] += extra["count"]
+            rollup["last_seen"] = max(rollup["last_seen"], extra["last_seen"])
+            window_count += extra["count"]
+        summaries.append((rollup, window_start, window_count))
+    for client_name, extra in pending.items():
+        summaries.append(({"client_name": client_name, **extra}, extra["first_seen"], extra["count"]))
+
+    results = []
+    for rollup, window_start, window_count in sorted(summaries, key=lambda s: s[0]["client_name"]):
+        # At least a minute, so a client's first few heartbeats don't read as a burst
+        window_minutes = max((now - window_start).total_seconds(), 60) / 60
+        results.append({
+            "client_name": rollup["client_name"],
+            "count": rollup["count"],
+            "first_seen": rollup["first_seen"],
+            "last_seen": rollup["last_seen"],
+            "rate_per_minute": round(window_count / window_minutes, 3),
+        })
+    return ORJSONResponse(results)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -439,15 +1479,89 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
+)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', 1024)),
+    skip_prefixes=("/api/chat/generations", "/api/chat/batch", "/api/chat/export", "/api/admin/export"),
 )
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
-# Configure logging
+# Configure logging; records carry the ids of the span they were logged in
+install_log_correlation()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [trace=%(trace_id)s span=%(span_id)s] - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def ensure_indexes():
+    """Create the indexes every query in this module relies on.
+
+    tests/test_query_plans.py fails on any query that would scan a
+    collection or sort in memory, so new query shapes need an entry here.
+    """
+    indexes = [
+        # Full-text search over a user's history. "none" disables English
+        # stemming and stop words, which would mangle Kurdish text. Messages
+        # carry their own "language" field, which Mongo would otherwise read
+        # as a per-document text language and reject codes such as "ku".
+        (db.chat_messages, [("user_id", ASCENDING), ("content", TEXT)], {
+            "name": "user_content_text",
+            "default_language": "none",
+            "language_override": "text_language",
+        }),
+        # Per-session history, read in timestamp order by the chat, message
+        # list and export endpoints
+        (db.chat_messages, [("session_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+        # Message lookups by id, e.g. recalled memory
+        (db.chat_messages, [("id", ASCENDING)], {}),
+        # Session lookups by id, the user's list newest first (and its ETag
+        # validator), the user's export in creation order, and the admin
+        # dashboard's recent activity
+        (db.chat_sessions, [("id", ASCENDING)], {"unique": True}),
+        (db.chat_sessions, [("user_id", ASCENDING), ("updated_at", DESCENDING)], {}),
+        (db.chat_sessions, [("user_id", ASCENDING), ("created_at", ASCENDING)], {}),
+        (db.chat_sessions, [("updated_at", DESCENDING)], {}),
+        # Incremental sync, and expire_session_tombstones()
+        (db.chat_sessions, [("user_id", ASCENDING), ("change_seq", ASCENDING)], {}),
+        (db.session_tombstones, [("user_id", ASCENDING), ("change_seq", ASCENDING)], {}),
+        (db.session_tombstones, [("user_id", ASCENDING), ("deleted_at", ASCENDING)], {}),
+        # Every authenticated request looks the user up by id; register and
+        # login by email and username
+        (db.users, [("id", ASCENDING)], {"unique": True}),
+        (db.users, [("email", ASCENDING)], {"unique": True}),
+        (db.users, [("username", ASCENDING)], {"unique": True}),
+        (db.users, [("created_at", DESCENDING)], {}),
+        (db.admin_prompts, [("id", ASCENDING)], {"unique": True}),
+        (db.admin_prompts, [("created_at", DESCENDING)], {}),
+        # Raw heartbeats are only kept for STATUS_RETENTION_SECONDS
+        (db.status_checks, [("timestamp", ASCENDING)], {"expireAfterSeconds": STATUS_RETENTION_SECONDS}),
+        (db.status_rollups, [("client_name", ASCENDING)], {"unique": True}),
+    ]
+    # Tombstones used to expire through a TTL index, which would delete them
+    # without raising the tombstone horizon
+    try:
+        await db.session_tombstones.drop_index("deleted_at_1")
+    except OperationFailure:
+        pass  # already gone
+    for collection, keys, options in indexes:
+        # One bad index (e.g. duplicates blocking a unique one) shouldn't
+        # keep the rest from being built. Connection errors are raised so
+        # the caller can retry.
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error(f"Creating index {keys} on {collection.name} failed: {str(e)}")
+
+async def retry_ensure_indexes():
+    global indexes_ready
+    while not indexes_ready:
+        await asyncio.sleep(INDEX_RETRY_SECONDS)
+        try:
+            await ensure_indexes()
+            indexes_ready = True
+            logger.info("Indexes created after MongoDB became reachable")
+        except Exception as e:
+            logger.warning(f"Index creation still failing: {str(e)}")
@@ -0,0 +1,349 @@
+"""
+Request tracing with spans that follow the OpenTelemetry data model.
+
+Every HTTP request gets a root span (continuing the caller's trace when a W3C
+`traceparent` header is sent), and code under it opens child spans with
+`tracer.span(...)`. MongoCommandListener turns every driver command into a
+child span of whatever span issued it; Motor runs commands on a thread pool
+but copies the caller's contextvars, so the parent is found there too.
+
+Finished spans of sampled traces go to an exporter as one JSON object per
+line, with OTLP field names (traceId, spanId, parentSpanId, startTimeUnixNano,
+...) so they can be loaded by OpenTelemetry tooling or just grepped. Ending a
+span only queues it; a background thread serializes and writes queued spans
+in batches, so neither the event loop nor Motor's threads wait on I/O. The
+sampling decision is made once per trace, at the root, and inherited from the
+caller's traceparent flags when present.
+
+Log records get `trace_id` and `span_id` attributes (see
+install_log_correlation) so log lines can be joined to spans.
+"""
+
+import contextvars
+import logging
+import queue
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import orjson
+from pymongo import monitoring
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+_traceparent_re = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def current_span() -> Optional["Span"]:
+    return _current_span.get()
+
+
+class Span:
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        kind: str = "INTERNAL",
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "UNSET"
+        self.status_message: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            self.tracer.exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "resource": {"service.name": self.tracer.service_name},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.status_message or ""},
+        }
+
+
+class NoopExporter:
+    def export(self, span: Span):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class StreamExporter:
+    """Writes finished spans as JSON lines to a text stream from a background thread.
+
+    Spans are queued by export() and written up to `batch_size` at a time,
+    with one flush per batch. When more than `max_queue` spans are waiting,
+    new ones are dropped and counted in `dropped`.
+    """
+
+    _STOP = object()
+
+    def __init__(self, stream, max_queue: int = 10000, batch_size: int = 512):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        # Started on first use so that creating an exporter has no side effects
+        with self._start_lock:
+            if self._thread is None:
+                self._open()
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(span is self._STOP for span in batch)
+            lines = [
+                orjson.dumps(span.to_dict(), default=str).decode() + "\n"
+                for span in batch
+                if span is not self._STOP
+            ]
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Writing {len(lines)} spans failed: {e}")
+            if stop:
+                return
+
+    # Hooks for subclasses that own their stream: called before the writer
+    # thread starts and after it has stopped
+    def _open(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def shutdown(self, timeout: float = 5):
+        """Write out the spans still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._close()
+        self._thread = None
+
+
+class FileExporter(StreamExporter):
+    """Appends spans to `path`, opened on first export and closed on shutdown."""
+
+    def __init__(self, path: str, **options):
+        super().__init__(None, **options)
+        self.path = path
+
+    def _open(self):
+        self.stream = open(self.path, "a", encoding="utf-8")
+
+    def _close(self):
+        self.stream.close()
+        self.stream = None
+
+
+def make_exporter(name: str, path: str = "traces.jsonl"):
+    if name == "console":
+        return StreamExporter(sys.stderr)
+    if name == "file":
+        return FileExporter(path)
+    return NoopExporter()
+
+
+class Tracer:
+    def __init__(self, service_name: str, exporter=None, sample_rate: float = 1.0):
+        self.service_name = service_name
+        self.exporter = exporter or NoopExporter()
+        self.sample_rate = sample_rate
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        traceparent: Optional[str] = None,
+        kind: str = "INTERNAL",
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Span:
+        """Start a span under `parent`, or a root span continuing `traceparent`."""
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+        match = _traceparent_re.match(traceparent or "")
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1)
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < self.sample_rate
+        return Span(self, name, trace_id, parent_id, sampled, kind, attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Run the block in a child span of the current span."""
+        span = self.start_span(name, parent=current_span(), attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request.
+
+    The span lasts until the response body is fully sent, so streaming
+    endpoints are timed correctly, and its id is returned in X-Trace-Id.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        span = self.tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent,
+            kind="SERVER",
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        token = _current_span.set(span)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = "ERROR"
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", span.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            # The router has resolved the endpoint by now; name the span after
+            # it rather than the raw path, which contains ids
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                span.name = f"{scope['method']} {endpoint.__name__}"
+            _current_span.reset(token)
+            span.end()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records each MongoDB command as a child span of the issuing span."""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans: Dict[Any, Span] = {}
+
+    def started(self, event):
+        parent = current_span()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        span = self.tracer.start_span(
+            f"mongo.{event.command_name}",
+            parent=parent,
+            kind="CLIENT",
+            attributes={
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None,
+            },
+        )
+        self._spans[(event.request_id, event.connection_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            span.status = "ERROR"
+            span.status_message = str(event.failure.get("errmsg", "")) if isinstance(event.failure, dict) else ""
+            span.end()
+
+
+def install_log_correlation():
+    """Add trace_id / span_id attributes to every log record."""
+    previous_factory = logging.getLogRecordFactory()
+
+    def factory(*args, **kwargs):
+        record = previous_factory(*args, **kwargs)
+        span = current_span()
+        record.trace_id = span.trace_id if span else "-"
+        record.span_id = span.span_id if span else "-"
+        return record
+
+    logging.setLogRecordFactory(factory)
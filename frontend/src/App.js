@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useContext, createContext } from 'react';
+import React, { useState, useEffect, useRef, useContext, createContext } from 'react';
 import axios from 'axios';
 import './App.css';
 
@@ -276,6 +276,16 @@ const ChatMessage = ({ message, isUser }) => {
   );
 };
 
+const mergeSessionChanges = (sessions, changes) => {
+  if (changes.reset) return changes.sessions;
+  const removed = new Set([
+    ...changes.deleted,
+    ...changes.sessions.map(session => session.id)
+  ]);
+  return [...changes.sessions, ...sessions.filter(session => !removed.has(session.id))]
+    .sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at));
+};
+
 const ChatInterface = () => {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
@@ -289,10 +299,20 @@ const ChatInterface = () => {
     fetchSessions();
   }, []);
 
+  // Cursor into the server's session change log; 0 means "send everything"
+  const sessionsCursor = useRef(0);
+
   const fetchSessions = async () => {
     try {
-      const response = await axios.get(`${API}/chat/sessions`);
-      setSessions(response.data);
+      let data;
+      do {
+        const response = await axios.get(`${API}/chat/sessions/changes`, {
+          params: { since: sessionsCursor.current }
+        });
+        data = response.data;
+        sessionsCursor.current = data.cursor;
+        setSessions(prev => mergeSessionChanges(prev, data));
+      } while (data.has_more);
     } catch (error) {
       console.error('Error fetching sessions:', error);
     }
@@ -323,12 +343,23 @@ const ChatInterface = () => {
     setInput('');
     setLoading(true);
 
+    // Reusing the same generation id on a retry reattaches to the answer the
+    // server is already producing instead of generating it a second time
+    const chatRequest = {
+      message: input,
+      session_id: currentSessionId,
+      language: 'en',
+      generation_id: crypto.randomUUID()
+    };
+
     try {
-      const response = await axios.post(`${API}/chat/send`, {
-        message: input,
-        session_id: currentSessionId,
-        language: 'en'
-      });
+      let response;
+      try {
+        response = await axios.post(`${API}/chat/send`, chatRequest);
+      } catch (error) {
+        if (error.response) throw error;
+        response = await axios.post(`${API}/chat/send`, chatRequest);
+      }
 
       const aiMessage = {
         content: response.data.ai_response,
@@ -409,8 +440,14 @@ const ChatInterface = () => {
               >
                 <div className="flex-1 min-w-0">
                   <p className="text-sm font-medium truncate">{session.title}</p>
+                  {session.last_message_preview && (
+                    <p className="text-xs text-gray-300 truncate">
+                      {session.last_role === 'user' ? 'You: ' : ''}{session.last_message_preview}
+                    </p>
+                  )}
                   <p className="text-xs text-gray-400">
                     {new Date(session.updated_at).toLocaleDateString()}
+                    {session.message_count > 0 && ` · ${session.message_count}`}
                   </p>
                 </div>
                 <button
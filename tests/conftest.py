@@ -0,0 +1,62 @@
+"""
+Shared test setup.
+
+Backend modules import each other by bare name (server.py does
+`from generations import ...`), so backend/ goes on sys.path. server.py reads
+its configuration when it is imported, and whichever test module imports it
+first fixes it for the whole run, so the settings every test relies on are
+set here: no LLM pre-import, no trace output, a small Mongo pool, and
+heartbeats flushed one at a time.
+
+Tests that need a real database use the `mongo` fixture, which connects to
+QUERY_PLAN_MONGO_URL (default mongodb://localhost:27017) and skips when
+nothing is listening there. Endpoint tests that only need plain reads and
+writes use `memory_db`, which points server.db at an in-memory mongomock
+database for the duration of the test.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+MONGO_URL = os.environ.get("QUERY_PLAN_MONGO_URL", "mongodb://localhost:27017")
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+for key, value in {
+    "MONGO_URL": MONGO_URL,
+    "DB_NAME": "kurdcine_tests",
+    "GOOGLE_API_KEY": "test-key",
+    "LLM_PREIMPORT": "0",
+    "MONGO_MIN_POOL_SIZE": "1",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "1000",
+    "HEARTBEAT_FLUSH_SIZE": "1",
+    "TRACE_EXPORTER": "none",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture(scope="module")
+def mongo():
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        pytest.skip(f"No MongoDB at {MONGO_URL}: {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    database = mongomock_motor.AsyncMongoMockClient()["kurdcine_tests"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "legacy_change_seq", None)
+    return database
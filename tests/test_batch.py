@@ -0,0 +1,116 @@
+"""POST /api/chat/batch: ownership, per-session ordering and the generation store."""
+
+import asyncio
+import types
+
+import orjson
+import pytest
+
+pytest.importorskip("motor")
+
+import server
+
+ALICE = server.User(id="alice", email="alice@example.com", username="alice", password_hash="x")
+
+
+class CannedModel:
+    """Answers "reply to <last user message>" after a short delay, recording each prompt."""
+
+    prompts = []
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    async def generate_content_async(self, conversation_history, stream=True):
+        self.prompts.append([part for turn in conversation_history[1:] for part in turn["parts"]])
+        await asyncio.sleep(0.01)
+        reply = f"reply to {conversation_history[-1]['parts'][0]}"
+
+        async def chunks():
+            yield types.SimpleNamespace(text=reply)
+
+        return chunks()
+
+
+@pytest.fixture
+def canned_model(monkeypatch):
+    CannedModel.prompts = []
+
+    genai = types.SimpleNamespace(
+        GenerativeModel=CannedModel,
+        types=types.SimpleNamespace(
+            BlockedPromptException=type("BlockedPromptException", (Exception,), {}),
+            StopCandidateException=type("StopCandidateException", (Exception,), {}),
+        ),
+    )
+
+    async def load_genai():
+        return genai
+
+    monkeypatch.setattr(server, "load_genai", load_genai)
+    monkeypatch.setattr(server, "MEMORY_ENABLED", False)
+    return CannedModel
+
+
+def run_batch(items, **options):
+    async def scenario():
+        request = server.BatchChatRequest(items=items, **options)
+        response = await server.send_batch(request, ALICE)
+        lines = [line async for line in response.body_iterator]
+        return sorted((orjson.loads(line) for line in lines), key=lambda result: result["index"])
+
+    return asyncio.run(scenario())
+
+
+async def insert_session(db, session_id, user_id):
+    await db.chat_sessions.insert_one(server.ChatSession(id=session_id, user_id=user_id, title="t").dict())
+
+
+def test_items_of_one_session_run_in_order(memory_db, canned_model):
+    asyncio.run(insert_session(memory_db, "first", "alice"))
+    asyncio.run(insert_session(memory_db, "second", "alice"))
+    results = run_batch(
+        [{"message": "one", "session_id": "first"},
+         {"message": "two", "session_id": "first"},
+         {"message": "three", "session_id": "second"},
+         {"message": "four", "session_id": "first"}],
+        concurrency=4,
+    )
+    assert [result["ai_response"] for result in results] == [
+        "reply to one", "reply to two", "reply to three", "reply to four",
+    ]
+    # Each turn of "first" saw the whole turn before it and nothing queued after it
+    first_prompts = [prompt for prompt in canned_model.prompts if prompt[0] == "one"]
+    assert first_prompts == [
+        ["one"],
+        ["one", "reply to one", "two"],
+        ["one", "reply to one", "two", "reply to two", "four"],
+    ]
+    assert ["three"] in canned_model.prompts
+
+
+def test_sessions_of_other_users_are_not_found(memory_db, canned_model):
+    asyncio.run(insert_session(memory_db, "mine", "alice"))
+    asyncio.run(insert_session(memory_db, "theirs", "bob"))
+    results = run_batch([
+        {"message": "hello", "session_id": "theirs"},
+        {"message": "hello", "session_id": "missing"},
+        {"message": "hello", "session_id": "mine"},
+    ])
+    assert results[0] == {"index": 0, "error": "Session not found", "status_code": 404}
+    assert results[1] == {"index": 1, "error": "Session not found", "status_code": 404}
+    assert results[2]["ai_response"] == "reply to hello"
+    # Nothing was written to the other user's session
+    messages = asyncio.run(memory_db.chat_messages.find({"session_id": "theirs"}).to_list(None))
+    assert messages == []
+
+
+def test_batch_generations_stay_out_of_the_generation_store(memory_db, canned_model, monkeypatch):
+    store = server.GenerationStore(max_entries=2)
+    monkeypatch.setattr(server, "generation_store", store)
+    kept = store.create("bob", "session", "bob-generation")
+
+    results = run_batch([{"message": f"question {i}"} for i in range(5)])
+    assert all("generation_id" not in result for result in results)
+    assert len({result["session_id"] for result in results}) == 5
+    assert len(store) == 1 and store.get("bob-generation", "bob") is kept
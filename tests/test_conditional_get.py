@@ -0,0 +1,115 @@
+"""ETags and 304 responses of the session and message lists."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("motor")
+
+from starlette.requests import Request
+
+import server
+
+ALICE = server.User(id="alice", email="alice@example.com", username="alice", password_hash="x")
+
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_weak_etag_depends_on_every_part():
+    etag = server.weak_etag("user", 3, datetime(2024, 1, 1))
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == server.weak_etag("user", 3, datetime(2024, 1, 1))
+    assert etag != server.weak_etag("user", 4, datetime(2024, 1, 1))
+
+
+def test_etag_matches():
+    etag = server.weak_etag("user", 1)
+    strong = etag.removeprefix("W/")
+    assert server.etag_matches(request_with(etag), etag)
+    # Weak comparison ignores W/, and lists are searched
+    assert server.etag_matches(request_with(strong), etag)
+    assert server.etag_matches(request_with(f'"other", {etag}'), etag)
+    assert server.etag_matches(request_with("*"), etag)
+    assert not server.etag_matches(request_with('W/"other"'), etag)
+    assert not server.etag_matches(request_with(), etag)
+
+
+@pytest.fixture
+def client(memory_db):
+    from fastapi.testclient import TestClient
+
+    server.app.dependency_overrides[server.get_current_user] = lambda: ALICE
+    # Not entered as a context manager, so the lifespan (and its real Mongo
+    # client) never runs
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def revalidate(client, path, etag):
+    return client.get(path, headers={"If-None-Match": etag})
+
+
+def insert_session(db, session_id, change_seq):
+    session = server.ChatSession(id=session_id, user_id="alice", title="Films", change_seq=change_seq)
+    asyncio.run(db.chat_sessions.insert_one(session.dict()))
+
+
+def test_session_list_is_not_modified_until_a_session_changes(client, memory_db):
+    insert_session(memory_db, "session", change_seq=1)
+
+    first = client.get("/api/chat/sessions")
+    assert first.status_code == 200
+    assert [row["id"] for row in first.json()] == ["session"]
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = revalidate(client, "/api/chat/sessions", etag)
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    # Every write stamps a new change_seq
+    asyncio.run(memory_db.chat_sessions.update_one(
+        {"id": "session"}, {"$set": {"title": "Kurdish films", "change_seq": 2}}
+    ))
+    changed = revalidate(client, "/api/chat/sessions", etag)
+    assert changed.status_code == 200
+    assert changed.json()[0]["title"] == "Kurdish films"
+    assert changed.headers["etag"] != etag
+
+    # Deleting an older session only changes the count
+    insert_session(memory_db, "older", change_seq=0)
+    etag = client.get("/api/chat/sessions").headers["etag"]
+    asyncio.run(memory_db.chat_sessions.delete_one({"id": "older"}))
+    assert revalidate(client, "/api/chat/sessions", etag).status_code == 200
+
+
+def test_message_list_is_not_modified_until_a_message_is_added(client, memory_db):
+    insert_session(memory_db, "session", change_seq=1)
+    message = server.ChatMessage(session_id="session", user_id="alice", content="Silav", role="user")
+    asyncio.run(memory_db.chat_messages.insert_one(message.dict()))
+
+    first = client.get("/api/chat/sessions/session/messages")
+    assert first.status_code == 200
+    assert [row["content"] for row in first.json()] == ["Silav"]
+    etag = first.headers["etag"]
+    assert revalidate(client, "/api/chat/sessions/session/messages", etag).status_code == 304
+
+    # The user's message is saved before the session's updated_at moves
+    reply = server.ChatMessage(session_id="session", user_id="alice", content="Silav!", role="assistant")
+    asyncio.run(memory_db.chat_messages.insert_one(reply.dict()))
+    changed = revalidate(client, "/api/chat/sessions/session/messages", etag)
+    assert changed.status_code == 200
+    assert [row["content"] for row in changed.json()] == ["Silav", "Silav!"]
+
+
+def test_etags_are_per_user(client, memory_db):
+    insert_session(memory_db, "session", change_seq=1)
+    etag = client.get("/api/chat/sessions").headers["etag"]
+    server.app.dependency_overrides[server.get_current_user] = lambda: ALICE.copy(update={"id": "bob"})
+    assert revalidate(client, "/api/chat/sessions", etag).status_code == 200
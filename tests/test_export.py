@@ -0,0 +1,79 @@
+"""NDJSON framing, chunking and gzip of the chat and admin exports."""
+
+import asyncio
+import gzip
+from datetime import datetime
+
+import orjson
+import pytest
+
+pytest.importorskip("motor")
+
+import server
+
+SESSION = {"id": "session", "title": "Kurdish films", "created_at": datetime(2024, 1, 1)}
+MESSAGES = [
+    {"id": f"message-{i}", "session_id": "session", "content": "ڕۆژباش " * i, "role": "user"}
+    for i in range(50)
+]
+
+
+async def export_lines():
+    yield server.ndjson_line("session", SESSION)
+    for message in MESSAGES:
+        yield server.ndjson_line("message", message)
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def read_ndjson(body: bytes):
+    assert body.endswith(b"\n")
+    return [orjson.loads(line) for line in body.splitlines()]
+
+
+def test_ndjson_line_is_one_tagged_document():
+    line = server.ndjson_line("session", SESSION)
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert orjson.loads(line) == {
+        "type": "session", "id": "session", "title": "Kurdish films", "created_at": "2024-01-01T00:00:00",
+    }
+
+
+def test_chunked_groups_whole_lines():
+    chunks = asyncio.run(collect(server.chunked(export_lines(), size=256)))
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 256 for chunk in chunks[:-1])
+    # Chunks only ever end at a line boundary
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    documents = read_ndjson(b"".join(chunks))
+    assert [document["type"] for document in documents] == ["session"] + ["message"] * len(MESSAGES)
+    assert documents[-1]["content"] == MESSAGES[-1]["content"]
+
+
+def test_export_response_plain_and_gzipped():
+    plain = server.export_response(export_lines(), "kurdcine-chat-export", gzip=False)
+    assert plain.media_type == "application/x-ndjson"
+    assert plain.headers["content-disposition"].endswith('.ndjson"')
+    body = b"".join(asyncio.run(collect(plain.body_iterator)))
+
+    packed = server.export_response(export_lines(), "kurdcine-chat-export", gzip=True)
+    assert packed.media_type == "application/gzip"
+    assert packed.headers["content-disposition"].endswith('.ndjson.gz"')
+    assert gzip.decompress(b"".join(asyncio.run(collect(packed.body_iterator)))) == body
+    assert len(read_ndjson(body)) == len(MESSAGES) + 1
+
+
+def test_admin_export_leaves_out_password_hashes(memory_db):
+    async def scenario():
+        await memory_db.users.insert_one({
+            "id": "user", "email": "user@example.com", "password_hash": "secret", "created_at": datetime(2024, 1, 1),
+        })
+        await memory_db.chat_sessions.insert_one({**SESSION, "user_id": "user"})
+        await memory_db.chat_messages.insert_one({**MESSAGES[1], "timestamp": datetime(2024, 1, 1)})
+        return b"".join([line async for line in server.export_everything()])
+
+    body = asyncio.run(scenario())
+    assert b"password_hash" not in body and b"secret" not in body
+    assert [document["type"] for document in read_ndjson(body)] == ["user", "session", "message"]
@@ -0,0 +1,102 @@
+"""Generation buffering and the bounded, expiring GenerationStore."""
+
+import asyncio
+
+import pytest
+
+import generations
+from generations import Generation, GenerationStore
+
+
+def test_follow_replays_buffered_text_then_streams_the_rest():
+    async def scenario():
+        generation = Generation("user", "session")
+        await generation.append("Hello")
+
+        async def produce():
+            await asyncio.sleep(0.01)
+            await generation.append(", world")
+            await generation.finish(message_id="message")
+
+        producer = asyncio.create_task(produce())
+        received = [text async for text in generation.follow()]
+        await producer
+        return generation, received
+
+    generation, received = asyncio.run(scenario())
+    assert "".join(received) == "Hello, world"
+    assert generation.text == "Hello, world"
+    assert generation.length == len("Hello, world")
+    assert generation.message_id == "message"
+
+
+def test_follow_skips_text_before_offset():
+    async def scenario():
+        generation = Generation("user", "session")
+        await generation.append("abcdef")
+        await generation.finish()
+        return [text async for text in generation.follow(offset=4)]
+
+    assert asyncio.run(scenario()) == ["ef"]
+
+
+def test_empty_chunks_are_ignored():
+    async def scenario():
+        generation = Generation("user", "session")
+        await generation.append("")
+        return generation
+
+    assert asyncio.run(scenario()).chunks == []
+
+
+def test_wait_returns_once_finished_with_error():
+    async def scenario():
+        generation = Generation("user", "session")
+        waiter = asyncio.create_task(generation.wait())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        await generation.finish(error="failed")
+        await asyncio.wait_for(waiter, 1)
+        return generation
+
+    assert asyncio.run(scenario()).error == "failed"
+
+
+def test_get_is_scoped_to_the_owner():
+    store = GenerationStore()
+    generation = store.create("alice", "session", "generation-1")
+    assert store.get("generation-1", "alice") is generation
+    assert store.get("generation-1", "bob") is None
+    assert store.exists("generation-1")
+
+
+def test_create_refuses_an_id_in_use():
+    store = GenerationStore()
+    store.create("alice", "session", "generation-1")
+    with pytest.raises(KeyError):
+        store.create("alice", "session", "generation-1")
+    store.discard("generation-1")
+    store.create("alice", "session", "generation-1")
+
+
+def test_oldest_entries_are_dropped_over_the_limit():
+    store = GenerationStore(max_entries=2)
+    for i in range(3):
+        store.create("alice", "session", f"generation-{i}")
+    assert len(store) == 2
+    assert not store.exists("generation-0")
+
+
+def test_finished_generations_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(generations.time, "monotonic", lambda: now[0])
+    store = GenerationStore(ttl_seconds=60)
+    finished = store.create("alice", "session", "finished")
+    store.create("alice", "session", "running")
+    asyncio.run(finished.finish())
+
+    now[0] += 61
+    store.purge()
+    assert not store.exists("finished")
+    # Still running: kept however old it is
+    assert store.exists("running")
@@ -0,0 +1,70 @@
+"""Liveness and readiness probes."""
+
+import asyncio
+import types
+
+import orjson
+import pytest
+
+pytest.importorskip("motor")
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import server
+
+
+def probe(endpoint):
+    response = asyncio.run(endpoint())
+    if isinstance(response, dict):
+        return 200, response
+    return response.status_code, orjson.loads(response.body)
+
+
+def test_liveness_reports_uptime_and_startup_timings(monkeypatch):
+    monkeypatch.setattr(server, "startup_timings", {"total_seconds": 0.5})
+    status, body = probe(server.liveness)
+    assert status == 200
+    assert body["status"] == "ok"
+    assert body["uptime_seconds"] > 0
+    assert body["startup"] == {"total_seconds": 0.5}
+
+
+def test_not_ready_before_startup(monkeypatch):
+    monkeypatch.setattr(server, "app_ready", False)
+    monkeypatch.setattr(server, "indexes_ready", True)
+    status, body = probe(server.readiness)
+    assert status == 503
+    assert body["status"] == "not_ready"
+    assert "db" not in body["checks"]
+
+
+def test_ready_once_started_with_indexes_and_database(memory_db, monkeypatch):
+    monkeypatch.setattr(server, "app_ready", True)
+    monkeypatch.setattr(server, "indexes_ready", True)
+    status, body = probe(server.readiness)
+    assert status == 200
+    assert body["status"] == "ready"
+    assert body["checks"]["db"] == "ok"
+    assert body["checks"]["indexes"] is True
+
+
+def test_not_ready_while_indexes_are_missing(memory_db, monkeypatch):
+    monkeypatch.setattr(server, "app_ready", True)
+    monkeypatch.setattr(server, "indexes_ready", False)
+    status, body = probe(server.readiness)
+    assert status == 503
+    # The database itself is fine; only the indexes hold readiness back
+    assert body["checks"]["db"] == "ok"
+    assert body["checks"]["indexes"] is False
+
+
+def test_not_ready_when_the_database_is_unreachable(monkeypatch):
+    async def command(name):
+        raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(server, "app_ready", True)
+    monkeypatch.setattr(server, "indexes_ready", True)
+    monkeypatch.setattr(server, "db", types.SimpleNamespace(command=command))
+    status, body = probe(server.readiness)
+    assert status == 503
+    assert body["checks"]["db"] == "unreachable: ServerSelectionTimeoutError"
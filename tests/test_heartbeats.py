@@ -0,0 +1,229 @@
+"""Heartbeat summaries, rollups, flush retries and status visibility of HeartbeatBuffer."""
+
+import asyncio
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import heartbeats
+from heartbeats import HeartbeatBuffer, summarize
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def heartbeat(client_name, seconds):
+    return {"client_name": client_name, "timestamp": START + timedelta(seconds=seconds)}
+
+
+def test_summarize_counts_and_bounds_per_client():
+    summary = summarize([heartbeat("a", 5), heartbeat("b", 1), heartbeat("a", 2), heartbeat("a", 9)])
+    assert summary == {
+        "a": {"count": 3, "first_seen": START + timedelta(seconds=2), "last_seen": START + timedelta(seconds=9)},
+        "b": {"count": 1, "first_seen": START + timedelta(seconds=1), "last_seen": START + timedelta(seconds=1)},
+    }
+    assert summarize([]) == {}
+
+
+class FakeStatusChecks:
+    """insert_many with Mongo's unordered semantics over a dict keyed by _id."""
+
+    def __init__(self):
+        self.rows = {}
+        self.fail_clients = set()
+        self.drop_connection_after_write = False
+        self.gate = None
+
+    async def insert_many(self, documents, ordered=True):
+        if self.gate:
+            await self.gate.wait()
+        errors = []
+        for index, document in enumerate(documents):
+            if document["_id"] in self.rows:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            elif document["client_name"] in self.fail_clients:
+                errors.append({"index": index, "code": 121, "errmsg": "validation failed"})
+            else:
+                self.rows[document["_id"]] = document
+        if self.drop_connection_after_write:
+            self.drop_connection_after_write = False
+            raise AutoReconnect("connection closed")
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+
+class RecordedUpdate:
+    """Stands in for pymongo's UpdateOne so the fake can read its parts."""
+
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+
+def evaluate(expression, document):
+    """The few aggregation operators the rollup pipeline uses."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])
+    if not isinstance(expression, dict):
+        return expression
+    ((operator, arguments),) = expression.items()
+    values = [evaluate(argument, document) for argument in arguments]
+    if operator == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if operator == "$add":
+        return None if None in values else sum(values)
+    if operator in ("$min", "$max"):
+        present = [value for value in values if value is not None]
+        return (min if operator == "$min" else max)(present)
+    if operator == "$lt":
+        # Missing fields sort before everything
+        return values[0] is None or (values[1] is not None and values[0] < values[1])
+    if operator == "$cond":
+        return values[1] if values[0] else values[2]
+    raise NotImplementedError(operator)
+
+
+class FakeRollups:
+    """bulk_write of upserting pipeline updates over a dict keyed by client."""
+
+    def __init__(self):
+        self.documents = {}
+        self.gate = None
+
+    async def bulk_write(self, updates, ordered=True):
+        if self.gate:
+            await self.gate.wait()
+        for update in updates:
+            name = update.filter["client_name"]
+            document = self.documents.get(name, {"client_name": name})
+            for stage in update.update:
+                document = {**document, **{
+                    field: evaluate(expression, document) for field, expression in stage["$set"].items()
+                }}
+            self.documents[name] = document
+
+    @property
+    def counts(self):
+        return {name: document["count"] for name, document in self.documents.items()}
+
+
+@pytest.fixture(autouse=True)
+def recorded_updates(monkeypatch):
+    monkeypatch.setattr(heartbeats, "UpdateOne", RecordedUpdate)
+
+
+def make_buffer(**options):
+    buffer = HeartbeatBuffer(max_size=100, **options)
+    buffer.db = types.SimpleNamespace(status_checks=FakeStatusChecks(), status_rollups=FakeRollups())
+    return buffer
+
+
+def test_flush_writes_and_rolls_up():
+    buffer = make_buffer()
+
+    async def scenario():
+        await buffer.add(heartbeat("a", 0))
+        await buffer.add(heartbeat("a", 1))
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert len(buffer.db.status_checks.rows) == 2
+    assert buffer.db.status_rollups.counts == {"a": 2}
+    assert buffer.pending_summary() == {}
+
+
+def test_ambiguous_failure_is_retried_without_double_counting():
+    buffer = make_buffer()
+    checks = buffer.db.status_checks
+    checks.drop_connection_after_write = True
+
+    async def scenario():
+        await buffer.add(heartbeat("a", 0))
+        await buffer.add(heartbeat("b", 0))
+        await buffer.flush()
+        # Written, but the outcome was lost: kept for retry, not rolled up yet
+        assert len(checks.rows) == 2
+        assert buffer.db.status_rollups.counts == {}
+        await buffer.add(heartbeat("c", 0))
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert len(checks.rows) == 3
+    assert buffer.db.status_rollups.counts == {"a": 1, "b": 1, "c": 1}
+    assert buffer.pending_summary() == {}
+
+
+def test_partial_failure_keeps_only_the_failed_rows():
+    buffer = make_buffer()
+    checks = buffer.db.status_checks
+    checks.fail_clients = {"bad"}
+
+    async def scenario():
+        await buffer.add(heartbeat("good", 0))
+        await buffer.add(heartbeat("bad", 0))
+        await buffer.flush()
+        assert {name: client["count"] for name, client in buffer.pending_summary().items()} == {"bad": 1}
+        checks.fail_clients = set()
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert buffer.db.status_rollups.counts == {"good": 1, "bad": 1}
+    assert buffer.pending_summary() == {}
+
+
+def test_rollups_accumulate_and_restart_expired_rate_windows():
+    buffer = make_buffer(rate_window=300)
+    rollups = buffer.db.status_rollups
+    now = datetime.utcnow()
+
+    async def send(*seconds):
+        for second in seconds:
+            await buffer.add({"client_name": "a", "timestamp": now + timedelta(seconds=second)})
+        await buffer.flush()
+
+    asyncio.run(send(0, 30))
+    asyncio.run(send(60))
+    rollup = rollups.documents["a"]
+    assert (rollup["count"], rollup["window_count"]) == (3, 3)
+    assert rollup["first_seen"] == rollup["window_start"] == now
+    assert rollup["last_seen"] == now + timedelta(seconds=60)
+
+    # Once the window is older than rate_window it starts over
+    rollup["window_start"] = now - timedelta(seconds=301)
+    asyncio.run(send(90))
+    rollup = rollups.documents["a"]
+    assert (rollup["count"], rollup["window_count"]) == (4, 1)
+    assert rollup["window_start"] == now + timedelta(seconds=90)
+    assert rollup["first_seen"] == now
+
+
+def test_batch_in_flight_stays_in_the_pending_summary():
+    buffer = make_buffer()
+    checks, rollups = buffer.db.status_checks, buffer.db.status_rollups
+
+    async def scenario():
+        checks.gate, rollups.gate = asyncio.Event(), asyncio.Event()
+        await buffer.add(heartbeat("a", 0))
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0)
+        # Inserting: counted once, although no longer waiting in the buffer
+        await buffer.add(heartbeat("a", 1))
+        assert buffer.pending_summary()["a"]["count"] == 2
+
+        checks.gate.set()
+        await asyncio.sleep(0)
+        # Written but not rolled up yet: still counted
+        assert checks.rows and rollups.documents == {}
+        assert buffer.pending_summary()["a"]["count"] == 2
+
+        rollups.gate.set()
+        await flush
+        assert rollups.counts == {"a": 1}
+        assert buffer.pending_summary()["a"]["count"] == 1
+
+    asyncio.run(scenario())
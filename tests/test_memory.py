@@ -0,0 +1,142 @@
+"""Embedding, per-session search and incremental indexing of MemoryStore."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from memory import Embedder, HashingEmbedder, MemoryStore, SessionIndex
+
+
+def test_embedder_is_abstract():
+    with pytest.raises(TypeError):
+        Embedder()
+
+
+def test_hashing_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dim=256)
+    vectors = asyncio.run(embedder.embed(["Kurdish cinema", "Kurdish cinema", "ڕۆژباش", "   "]))
+    assert vectors.shape == (4, 256)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1, rtol=1e-5)
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    assert not vectors[3].any()
+
+
+def test_hashing_embedder_ranks_related_text_higher():
+    embedder = HashingEmbedder()
+    query, related, unrelated = embedder.embed_sync([
+        "films by Kurdish directors",
+        "Which Kurdish film directors should I watch?",
+        "How do I bake bread at home?",
+    ])
+    assert query @ related > query @ unrelated
+
+
+def test_ngrams_do_not_span_words():
+    embedder = HashingEmbedder()
+    joined, split = embedder.embed_sync(["ab cd", "cd ab"])
+    # Same words in a different order: only within-word n-grams count
+    np.testing.assert_allclose(joined, split)
+
+
+def test_session_index_search_skips_excluded_and_low_scores():
+    index = SessionIndex(dim=3)
+    now = datetime.utcnow()
+    messages = [{"id": name, "timestamp": now} for name in ("a", "b", "c")]
+    index.add(messages, np.array([[1, 0, 0], [0.8, 0.6, 0], [0, 0, 1]], dtype=np.float32))
+    query = np.array([1, 0, 0], dtype=np.float32)
+
+    assert [hit for hit, _ in index.search(query, k=2, exclude=set(), min_score=0.1)] == ["a", "b"]
+    assert [hit for hit, _ in index.search(query, k=2, exclude={"a"}, min_score=0.1)] == ["b"]
+    assert index.search(query, k=5, exclude=set(), min_score=0.9) == [("a", 1.0)]
+    assert SessionIndex(dim=3).search(query, k=1, exclude=set(), min_score=0) == []
+
+
+def one_hot(rows, dim=8):
+    return np.eye(dim, dtype=np.float32)[[row % dim for row in rows]]
+
+
+def test_session_index_grows_in_place_and_keeps_the_newest_vectors():
+    index = SessionIndex(dim=8, max_vectors=5)
+    now = datetime.utcnow()
+
+    def add(numbers):
+        index.add([{"id": f"m{i}", "timestamp": now} for i in numbers], one_hot(numbers))
+
+    add([0, 1])
+    add([2])
+    assert index.ids == ["m0", "m1", "m2"]
+    assert len(index._buffer) == 4
+    add([3, 4, 5, 6])
+    # Capped at five rows; the two oldest dropped out, vectors still line up
+    assert index.ids == ["m2", "m3", "m4", "m5", "m6"]
+    assert index._buffer.shape == (5, 8)
+    np.testing.assert_array_equal(index.vectors, one_hot(range(2, 7)))
+    # A page bigger than the cap keeps only its own newest rows
+    add(range(10, 20))
+    assert index.ids == [f"m{i}" for i in range(15, 20)]
+    np.testing.assert_array_equal(index.vectors, one_hot(range(15, 20)))
+    assert index.search(one_hot([19])[0], k=1, exclude=set(), min_score=0.5) == [("m19", 1.0)]
+
+
+class FakeHistory:
+    """load_since over an in-memory message list, recording each call."""
+
+    def __init__(self, contents):
+        start = datetime(2024, 1, 1)
+        self.messages = [
+            {"id": f"m{i}", "content": content, "timestamp": start + timedelta(seconds=i)}
+            for i, content in enumerate(contents)
+        ]
+        self.calls = []
+
+    async def load_since(self, session_id, after, limit):
+        self.calls.append((after, limit))
+        newer = [m for m in self.messages if after is None or m["timestamp"] > after]
+        return newer[:limit]
+
+
+def test_memory_store_catches_up_in_pages():
+    history = FakeHistory([f"message number {i}" for i in range(5)])
+    store = MemoryStore(HashingEmbedder(), history.load_since, page_size=2)
+
+    hits = asyncio.run(store.relevant("session", "message number 3", k=1, exclude_ids=set()))
+    assert hits[0][0] == "m3"
+    assert len(history.calls) == 3
+    assert all(limit == 2 for _, limit in history.calls)
+
+
+def test_memory_store_picks_up_new_messages_and_forgets():
+    history = FakeHistory(["about Kurdish films"])
+    store = MemoryStore(HashingEmbedder(), history.load_since)
+    asyncio.run(store.relevant("session", "films", k=3, exclude_ids=set()))
+
+    history.messages.append({
+        "id": "new", "content": "bread recipes", "timestamp": datetime(2024, 1, 2),
+    })
+    hits = asyncio.run(store.relevant("session", "bread recipes", k=1, exclude_ids=set()))
+    assert hits[0][0] == "new"
+    # Only messages newer than the index were loaded the second time
+    assert history.calls[-1][0] == datetime(2024, 1, 1)
+
+    store.forget("session")
+    asyncio.run(store.relevant("session", "films", k=1, exclude_ids=set()))
+    assert history.calls[-1][0] is None
+
+
+def test_memory_store_evicts_least_recently_used_sessions():
+    history = FakeHistory(["text"])
+    store = MemoryStore(HashingEmbedder(), history.load_since, max_sessions=1)
+    asyncio.run(store.relevant("first", "text", k=1, exclude_ids=set()))
+    asyncio.run(store.relevant("second", "text", k=1, exclude_ids=set()))
+    assert list(store._indexes) == ["second"]
+
+
+def test_memory_store_caps_vectors_per_session():
+    history = FakeHistory([f"message number {i}" for i in range(7)])
+    store = MemoryStore(HashingEmbedder(), history.load_since, page_size=3, max_vectors=4)
+    hits = asyncio.run(store.relevant("session", "message number", k=10, exclude_ids=set()))
+    assert sorted(hit for hit, _ in hits) == ["m3", "m4", "m5", "m6"]
@@ -0,0 +1,199 @@
+"""Rule matching, latency ordering and failure handling of ModelRouter and generate_with_fallback."""
+
+import asyncio
+import types
+
+import pytest
+
+import model_router
+from generations import Generation
+from model_router import DEFAULT_MODEL, ModelRouter, has_code
+
+RULES = [
+    {"name": "code", "when": {"has_code": True}, "models": ["coder"]},
+    {"name": "long", "when": {"min_chars": 100}, "models": ["big"]},
+    {"name": "kurdish", "when": {"languages": ["ku"]}, "models": ["ku-model"]},
+    {"name": "quick", "when": {"max_chars": 20}, "models": ["slow", "fast"], "prefer": "fastest"},
+    {"name": "default", "when": {}, "models": ["general"]},
+]
+
+
+def test_has_code():
+    assert has_code("```python\nprint(1)\n```")
+    assert has_code("def main():\n    pass")
+    assert has_code("int x = 1;")
+    assert not has_code("Tell me about Kurdish cinema")
+
+
+def test_first_matching_rule_wins():
+    router = ModelRouter(RULES, fallback=["backup"])
+    assert router.route("def f():\n  return 1")["rule"] == "code"
+    assert router.route("x " * 60)["rule"] == "long"
+    assert router.route("a medium sized question", "ku")["rule"] == "kurdish"
+    assert router.route("hi")["rule"] == "quick"
+    assert router.route("a medium sized question")["rule"] == "default"
+
+
+def test_fallback_chain_is_appended_without_duplicates():
+    router = ModelRouter(RULES, fallback=["backup", "general"])
+    assert router.route("a medium sized question")["models"] == ["general", "backup"]
+
+
+def test_default_rules_route_quick_questions_to_the_fastest_flash_model():
+    router = ModelRouter()
+    code = router.route("def f():\n  return 1")
+    assert code["rule"] == "code" and code["models"][0] == DEFAULT_MODEL
+    assert router.route("x " * 1500)["models"][0] == DEFAULT_MODEL
+    assert router.route("a " * 200)["rule"] == "default"
+
+    for model, latency in [("gemini-2.0-flash-lite", 0.9), ("gemini-2.0-flash", 0.3), (DEFAULT_MODEL, 0.6)]:
+        router.record(model, latency, ok=True)
+    quick = router.route("Who directed Yol?")
+    assert quick["rule"] == "quick"
+    assert quick["models"] == ["gemini-2.0-flash", DEFAULT_MODEL, "gemini-2.0-flash-lite"]
+
+
+def test_fastest_prefers_unmeasured_then_lowest_latency():
+    router = ModelRouter(RULES, fallback=["backup"])
+    router.record("slow", 0.9, ok=True)
+    # "fast" has no sample yet, so it goes first to get one
+    assert router.route("hi")["models"][:2] == ["fast", "slow"]
+    router.record("fast", 0.1, ok=True)
+    assert router.route("hi")["models"][:2] == ["fast", "slow"]
+    # Exponentially weighted: two slow samples lift it to about 1.9s
+    router.record("fast", 5.0, ok=True)
+    router.record("fast", 5.0, ok=True)
+    assert router.route("hi")["models"][:2] == ["slow", "fast"]
+
+
+def test_model_moves_back_after_consecutive_failures_until_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: now[0])
+    router = ModelRouter(RULES, fallback=["backup"], max_consecutive_failures=3, error_cooldown=60)
+
+    for _ in range(2):
+        router.record("general", None, ok=False)
+    assert router.route("a medium sized question")["models"][0] == "general"
+
+    router.record("general", None, ok=False)
+    assert router.route("a medium sized question")["models"] == ["backup", "general"]
+
+    now[0] += 61
+    assert router.route("a medium sized question")["models"][0] == "general"
+    # A failed retry starts a new cooldown; a success resets the count
+    router.record("general", None, ok=False)
+    assert router.route("a medium sized question")["models"][0] == "backup"
+    router.record("general", 0.2, ok=True)
+    assert router.route("a medium sized question")["models"][0] == "general"
+
+
+def test_model_moves_back_on_a_high_error_rate_once_it_has_enough_requests(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: now[0])
+    router = ModelRouter(RULES, fallback=["backup"], alpha=0.5, max_error_rate=0.5, min_requests=6, error_cooldown=60)
+
+    # Every other request fails: never three in a row, but half of them
+    for _ in range(2):
+        router.record("general", 0.2, ok=True)
+        router.record("general", None, ok=False)
+    assert router.stats("general").error_rate >= 0.5
+    # Too few requests to judge yet
+    assert router.route("a medium sized question")["models"][0] == "general"
+
+    router.record("general", 0.2, ok=True)
+    router.record("general", None, ok=False)
+    assert router.route("a medium sized question")["models"] == ["backup", "general"]
+    now[0] += 61
+    assert router.route("a medium sized question")["models"][0] == "general"
+
+
+def test_snapshot_reports_per_model_stats():
+    router = ModelRouter(RULES)
+    router.record("general", 0.25, ok=True)
+    router.record("general", None, ok=False)
+    stats = router.snapshot()["models"]["general"]
+    assert stats["requests"] == 2
+    assert stats["latency_ms"] == 250.0
+    assert stats["consecutive_failures"] == 1
+    assert 0 < stats["error_rate"] < 1
+
+
+def test_from_json():
+    router = ModelRouter.from_json('[{"name": "only", "when": {}, "models": ["m"]}]')
+    assert router.route("anything")["rule"] == "only"
+    assert ModelRouter.from_json(None).rules == model_router.DEFAULT_RULES
+
+
+class Blocked(Exception):
+    pass
+
+
+class ScriptedModel:
+    """GenerativeModel whose behaviour per model name is set by the test."""
+
+    script = {}
+    calls = []
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    async def generate_content_async(self, conversation_history, stream=True):
+        self.calls.append(self.model_name)
+        outcome = self.script[self.model_name]
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        async def chunks():
+            for text in outcome:
+                if isinstance(text, Exception):
+                    raise text
+                yield types.SimpleNamespace(text=text)
+
+        return chunks()
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    server = pytest.importorskip("server")
+    genai = types.SimpleNamespace(
+        GenerativeModel=ScriptedModel,
+        types=types.SimpleNamespace(BlockedPromptException=Blocked, StopCandidateException=Blocked),
+    )
+
+    async def load_genai():
+        return genai
+
+    monkeypatch.setattr(server, "load_genai", load_genai)
+    monkeypatch.setattr(server, "model_router", ModelRouter(RULES))
+    ScriptedModel.calls = []
+    return server
+
+
+def generate(server, script):
+    ScriptedModel.script = script
+    generation = Generation("user", "session")
+    span = server.tracer.start_span("llm.generate")
+    asyncio.run(server.generate_with_fallback(generation, [], list(script), span))
+    return generation, span
+
+
+def test_api_errors_fall_back_and_count_against_the_model(scripted):
+    generation, _ = generate(scripted, {"general": ConnectionError("reset"), "backup": ["Silav", "!"]})
+    assert generation.text == "Silav!"
+    assert ScriptedModel.calls == ["general", "backup"]
+    assert scripted.model_router.stats("general").consecutive_failures == 1
+    assert scripted.model_router.stats("backup").requests == 1
+
+
+@pytest.mark.parametrize("blocked", [
+    Blocked("prompt blocked"),
+    # chunk.text raises ValueError when a chunk was stopped for safety
+    [ValueError("no text in this chunk")],
+])
+def test_blocked_content_is_not_a_model_failure(scripted, blocked):
+    generation, span = generate(scripted, {"general": blocked, "backup": ["unused"]})
+    assert generation.text == scripted.AI_ERROR_RESPONSE
+    assert ScriptedModel.calls == ["general"]
+    stats = scripted.model_router.stats("general")
+    assert (stats.requests, stats.consecutive_failures) == (0, 0)
+    assert span.status == "ERROR"
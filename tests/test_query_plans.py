@@ -0,0 +1,285 @@
+"""
+Query-plan regression test for backend/server.py.
+
+Drives the API through a scripted session against a local MongoDB, records
+every query the app sends, and explains each distinct query shape. The test
+fails when a winning plan contains a COLLSCAN, an in-memory SORT (or a
+$sort pipeline stage), or examines more than QUERY_PLAN_MAX_DOCS_EXAMINED
+documents while examining over QUERY_PLAN_MAX_EXAMINED_RATIO times what it
+returns. Full reads such as exports return what they examine and pass.
+
+A markdown report of every shape and its plan is written to
+QUERY_PLAN_REPORT (default tests/query_plan_report.md).
+
+Needs a MongoDB at QUERY_PLAN_MONGO_URL (default mongodb://localhost:27017);
+skipped otherwise (see conftest.py). The LLM is replaced by a canned model, so no API key or
+network access is used.
+"""
+
+import json
+import os
+import types
+import uuid
+from pathlib import Path
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from pymongo import monitoring
+
+MAX_DOCS_EXAMINED = int(os.environ.get("QUERY_PLAN_MAX_DOCS_EXAMINED", 200))
+MAX_EXAMINED_RATIO = float(os.environ.get("QUERY_PLAN_MAX_EXAMINED_RATIO", 2))
+REPORT_PATH = Path(os.environ.get("QUERY_PLAN_REPORT", Path(__file__).parent / "query_plan_report.md"))
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+DRIVER_FIELDS = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "$readPreference", "readConcern",
+    "writeConcern", "autocommit", "startTransaction", "batchSize", "cursor", "ordered",
+}
+
+
+class QueryRecorder(monitoring.CommandListener):
+    def __init__(self, database_name):
+        self.database_name = database_name
+        self.commands = []
+
+    def started(self, event):
+        if event.database_name == self.database_name and event.command_name in EXPLAINABLE:
+            self.commands.append(dict(event.command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def shape(value):
+    """Replace literal values with their type so equal query shapes compare equal."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(item) for item in value[:1]]
+    return type(value).__name__
+
+
+def query_shape(command):
+    name = next(iter(command))
+    body = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+    for statements in ("updates", "deletes"):
+        if statements in body:
+            body[statements] = [
+                {key: value for key, value in body[statements][0].items() if key in ("q", "u", "limit", "multi")}
+            ]
+    return json.dumps({"command": name, **shape(body)}, sort_keys=True, default=str)
+
+
+def explainable(command):
+    body = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+    for statements in ("updates", "deletes"):
+        if statements in body:
+            body[statements] = body[statements][:1]
+    if "aggregate" in body:
+        body["cursor"] = {}
+    return body
+
+
+def find_all(document, key):
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from find_all(value, key)
+    elif isinstance(document, list):
+        for item in document:
+            yield from find_all(item, key)
+
+
+def plan_stages(explain):
+    stages = []
+    for plan in find_all(explain, "winningPlan"):
+        stages.extend(stage for stage in find_all(plan, "stage") if isinstance(stage, str))
+    for pipeline_stage in explain.get("stages", []):
+        stages.extend(name for name in pipeline_stage if name.startswith("$") and name != "$cursor")
+    return stages
+
+
+def execution_counts(explain):
+    for stats in find_all(explain, "executionStats"):
+        if isinstance(stats, dict) and "totalDocsExamined" in stats:
+            return stats["totalDocsExamined"], stats.get("nReturned", 0)
+    return 0, 0
+
+
+def uses_text_search(command):
+    return "$text" in json.dumps(command, default=str)
+
+
+def problems(command, stages, examined, returned):
+    found = []
+    if "COLLSCAN" in stages:
+        found.append("COLLSCAN")
+    # Text search results are ranked by score, which Mongo can only sort in
+    # memory; the set is bounded by the user's matching messages
+    if ("SORT" in stages or "$sort" in stages) and not uses_text_search(command):
+        found.append("in-memory SORT")
+    if examined > MAX_DOCS_EXAMINED and examined > MAX_EXAMINED_RATIO * max(returned, 1):
+        found.append(f"examined {examined} docs for {returned} returned")
+    return found
+
+
+@pytest.fixture(scope="module")
+def app_run(mongo):
+    database_name = f"kurdcine_query_plans_{uuid.uuid4().hex[:8]}"
+    recorder = QueryRecorder(database_name)
+    monitoring.register(recorder)
+
+    # The rest of the configuration is set in conftest.py; the database
+    # name is read when the app starts
+    os.environ["DB_NAME"] = database_name
+    import server
+
+    class CannedModel:
+        def __init__(self, name):
+            self.name = name
+
+        async def generate_content_async(self, history, stream=False):
+            async def chunks():
+                yield types.SimpleNamespace(text="Canned answer about Kurdish cinema.")
+            return chunks()
+
+    server._genai = types.SimpleNamespace(
+        GenerativeModel=CannedModel,
+        types=types.SimpleNamespace(
+            BlockedPromptException=type("BlockedPromptException", (Exception,), {}),
+            StopCandidateException=type("StopCandidateException", (Exception,), {}),
+        ),
+    )
+
+    from fastapi.testclient import TestClient
+
+    seed_other_users(mongo[database_name])
+    with TestClient(server.app) as client:
+        run_script(client)
+
+    yield mongo[database_name], recorder.commands
+    mongo.drop_database(database_name)
+
+
+def seed_other_users(database):
+    """Background data so a scan over the wrong documents shows up in the counts."""
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    sessions, messages = [], []
+    for i in range(50):
+        session_id = str(uuid.uuid4())
+        user_id = f"other-user-{i % 10}"
+        sessions.append({
+            "id": session_id, "user_id": user_id, "title": "New Chat",
+            "created_at": now, "updated_at": now,
+        })
+        messages.extend({
+            "id": str(uuid.uuid4()), "session_id": session_id, "user_id": user_id,
+            "content": f"Background message {j} about films", "role": "user",
+            "timestamp": now, "language": "en",
+        } for j in range(20))
+    database.chat_sessions.insert_many(sessions)
+    database.chat_messages.insert_many(messages)
+
+
+def run_script(client):
+    api = "/api"
+
+    def ok(response):
+        assert response.status_code < 400, (response.request.url, response.status_code, response.text)
+        return response
+
+    user = {"email": "plan@example.com", "username": "plan_user", "password": "pw-123456"}
+    admin = {"email": "plan-admin@example.com", "username": "plan_admin", "password": "pw-123456"}
+    ok(client.post(f"{api}/auth/register", json=user))
+    admin_id = ok(client.post(f"{api}/auth/register", json=admin)).json()["id"]
+    user_headers = {"Authorization": "Bearer " + ok(client.post(f"{api}/auth/login", json=user)).json()["access_token"]}
+    ok(client.post(f"{api}/admin/create-admin/{admin_id}", headers=user_headers))
+    admin_headers = {"Authorization": "Bearer " + ok(client.post(f"{api}/auth/login", json=admin)).json()["access_token"]}
+    ok(client.get(f"{api}/auth/me", headers=user_headers))
+
+    # Long enough to go past the recent window and hit memory recall
+    session_id = None
+    for i in range(14):
+        response = ok(client.post(f"{api}/chat/send", headers=user_headers, json={
+            "message": f"Tell me about Kurdish film number {i}",
+            "session_id": session_id,
+            "generation_id": f"plan-generation-{i:04d}",
+        }))
+        session_id = response.json()["session_id"]
+    ok(client.get(f"{api}/chat/generations/plan-generation-0013", headers=user_headers))
+    ok(client.post(f"{api}/chat/send", headers=user_headers, json={
+        "message": "resend", "session_id": session_id, "generation_id": "plan-generation-0013",
+    }))
+    ok(client.post(f"{api}/chat/batch", headers=user_headers, json={
+        "items": [{"message": "synopsis"}, {"message": "translate", "session_id": session_id}],
+        "concurrency": 2,
+    }))
+
+    cursor = ok(client.get(f"{api}/chat/sessions/changes", headers=user_headers)).json()["cursor"]
+    sessions = ok(client.get(f"{api}/chat/sessions", headers=user_headers))
+    ok(client.get(f"{api}/chat/sessions", headers={**user_headers, "If-None-Match": sessions.headers["etag"]}))
+    ok(client.get(f"{api}/chat/sessions/{session_id}/messages", headers=user_headers))
+    ok(client.get(f"{api}/chat/search", headers=user_headers, params={"q": "Kurdish film"}))
+    ok(client.get(f"{api}/chat/export", headers=user_headers))
+
+    ok(client.post(f"{api}/status", json={"client_name": "plan-agent"}))
+    ok(client.get(f"{api}/status"))
+    ok(client.get(f"{api}/health/ready"))
+
+    ok(client.get(f"{api}/admin/analytics", headers=admin_headers))
+    prompt_id = ok(client.post(f"{api}/admin/prompts", headers=admin_headers, json={"name": "p", "content": "c"})).json()["id"]
+    ok(client.get(f"{api}/admin/prompts", headers=admin_headers))
+    ok(client.put(f"{api}/admin/prompts/{prompt_id}", headers=admin_headers, json={"name": "p2", "content": "c2"}))
+    ok(client.get(f"{api}/admin/export", headers=admin_headers))
+    ok(client.post(f"{api}/admin/backfill/session-summaries", headers=admin_headers))
+    ok(client.get(f"{api}/admin/backfill/session-summaries", headers=admin_headers))
+    ok(client.delete(f"{api}/admin/prompts/{prompt_id}", headers=admin_headers))
+    ok(client.delete(f"{api}/chat/sessions/{session_id}", headers=user_headers))
+    ok(client.get(f"{api}/chat/sessions/changes", headers=user_headers, params={"since": cursor}))
+
+
+def test_every_query_uses_an_index(app_run):
+    database, commands = app_run
+    assert commands, "no queries were recorded"
+
+    shapes = {}
+    for command in commands:
+        shapes.setdefault(query_shape(command), command)
+
+    rows, failures = [], []
+    for key, command in sorted(shapes.items()):
+        explain = database.command({"explain": explainable(command), "verbosity": "executionStats"})
+        stages = plan_stages(explain)
+        examined, returned = execution_counts(explain)
+        found = problems(command, stages, examined, returned)
+        rows.append((key, stages, examined, returned, found))
+        if found:
+            failures.append(f"{key}: {', '.join(found)} (plan: {' > '.join(stages)})")
+
+    write_report(rows)
+    assert not failures, "Queries without a usable index:\n" + "\n".join(failures)
+
+
+def write_report(rows):
+    lines = [
+        "# Query plan report",
+        "",
+        f"{len(rows)} query shapes; docs-examined threshold {MAX_DOCS_EXAMINED}.",
+        "",
+        "| Query shape | Plan stages | Examined | Returned | Result |",
+        "| --- | --- | ---: | ---: | --- |",
+    ]
+    for key, stages, examined, returned, found in rows:
+        result = "; ".join(found) if found else "ok"
+        lines.append(f"| `{key}` | {' > '.join(stages)} | {examined} | {returned} | {result} |")
+    REPORT_PATH.write_text("\n".join(lines) + "\n", encoding="utf-8")
@@ -0,0 +1,39 @@
+"""Snippets and highlights of /api/chat/search hits."""
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("motor")
+
+import server
+
+
+def search_message(content):
+    return {
+        "id": "message", "session_id": "session", "role": "user",
+        "content": content, "timestamp": datetime(2024, 1, 1), "score": 1.5,
+    }
+
+
+def highlighted(hit):
+    return [hit.snippet[start:end] for start, end in hit.highlights]
+
+
+def test_search_hit_highlights_whole_words_case_insensitively():
+    hit = server.build_search_hit(search_message("Kurdish FILM and filmmaking"), "film kurdish")
+    assert hit.snippet == "Kurdish FILM and filmmaking"
+    assert highlighted(hit) == ["Kurdish", "FILM"]
+
+
+def test_search_hit_cuts_a_snippet_around_the_first_match():
+    content = "x " * 200 + "Yilmaz Güney" + " y" * 200
+    hit = server.build_search_hit(search_message(content), "güney")
+    assert hit.snippet.startswith("…") and hit.snippet.endswith("…")
+    assert len(hit.snippet) == server.SEARCH_SNIPPET_CHARS + 2
+    assert highlighted(hit) == ["Güney"]
+
+
+def test_search_hit_highlights_kurdish_script():
+    hit = server.build_search_hit(search_message("فیلمی کوردی زۆر باشە"), "کوردی")
+    assert highlighted(hit) == ["کوردی"]
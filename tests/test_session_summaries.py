@@ -0,0 +1,95 @@
+"""Session titles and sidebar summaries: the live update and the backfill."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+
+import server
+
+START = datetime(2024, 1, 1)
+
+
+def test_shorten():
+    assert server.shorten("  short \n text ", 20) == "short text"
+    assert server.shorten("one two three four", 10) == "one two…"
+    assert server.shorten("x" * 30, 10) == "x" * 10 + "…"
+    assert server.shorten("```code``` here", 20) == "code here"
+
+
+def test_auto_title_uses_the_first_meaningful_line():
+    assert server.auto_title("```\n## How do I say hello?\nsecond line") == "How do I say hello?"
+    assert server.auto_title("> quoted question") == "quoted question"
+    assert len(server.auto_title("word " * 50)) <= server.SESSION_TITLE_CHARS + 1
+    assert server.auto_title(" \n ``` ") == server.DEFAULT_SESSION_TITLE
+
+
+def summary(document):
+    return {key: document.get(key) for key in ("title", "message_count", "last_message_preview", "last_role")}
+
+
+def test_turn_update_counts_previews_and_titles_default_sessions(memory_db):
+    sessions = memory_db.chat_sessions
+
+    async def scenario():
+        await sessions.insert_many([
+            {"id": "untitled", "title": server.DEFAULT_SESSION_TITLE, "message_count": 2},
+            {"id": "titled", "title": "Yilmaz Güney", "message_count": 4},
+            {"id": "legacy"},
+        ])
+        reply = {"content": "$5 on Tuesdays", "role": "assistant"}
+        for session_id in ("untitled", "titled", "legacy"):
+            update = server.session_summary_update(2, reply, 7, "## How much is a $ticket?")
+            await sessions.update_one({"id": session_id}, update)
+        return {doc["id"]: doc for doc in await sessions.find({}).to_list(None)}
+
+    documents = asyncio.run(scenario())
+    assert summary(documents["untitled"]) == {
+        "title": "How much is a $ticket?", "message_count": 4,
+        "last_message_preview": "$5 on Tuesdays", "last_role": "assistant",
+    }
+    assert summary(documents["titled"])["title"] == "Yilmaz Güney"
+    assert summary(documents["titled"])["message_count"] == 6
+    assert summary(documents["legacy"])["title"] == "How much is a $ticket?"
+    assert documents["legacy"]["message_count"] == 2
+    assert documents["untitled"]["change_seq"] == 7
+
+
+def test_backfill_counts_only_turns_the_session_was_written_for(memory_db):
+    async def scenario():
+        await memory_db.chat_sessions.insert_one(
+            {"id": "session", "user_id": "alice", "title": server.DEFAULT_SESSION_TITLE, "updated_at": START}
+        )
+        await memory_db.chat_messages.insert_many([
+            {"session_id": "session", "role": "user", "content": "Silav! Films?", "timestamp": START - timedelta(seconds=2)},
+            {"session_id": "session", "role": "assistant", "content": "Yol.", "timestamp": START - timedelta(seconds=1)},
+            # A turn still in flight adds itself when its reply is saved
+            {"session_id": "session", "role": "user", "content": "More?", "timestamp": START + timedelta(seconds=1)},
+        ])
+        assert await server.backfill_session_summary("session")
+        return await memory_db.chat_sessions.find_one({"id": "session"})
+
+    session = asyncio.run(scenario())
+    assert summary(session) == {
+        "title": "Silav! Films?", "message_count": 2, "last_message_preview": "Yol.", "last_role": "assistant",
+    }
+    assert session["updated_at"] == START
+    assert session["change_seq"] > 0
+
+
+def test_backfill_endpoint_keeps_a_reference_to_its_task(memory_db, monkeypatch):
+    monkeypatch.setattr(server, "backfill_status", {"running": False, "updated": 0, "scanned": 0, "error": None})
+    monkeypatch.setattr(server, "backfill_task", None)
+    admin = server.User(email="admin@example.com", username="admin", password_hash="-", is_admin=True)
+
+    async def scenario():
+        await memory_db.chat_sessions.insert_one({"id": "session", "user_id": "alice", "updated_at": START})
+        status = await server.start_session_summary_backfill(admin)
+        assert status["running"]
+        await server.backfill_task
+        return server.backfill_status
+
+    status = asyncio.run(scenario())
+    assert not status["running"] and status["scanned"] == 1 and status["error"] is None
@@ -0,0 +1,144 @@
+"""
+Incremental session sync must never hand out a cursor past a change that is
+still being written, and must reset a client whose cursor is older than the
+deletions it still remembers.
+
+The interleaving test drives two writers by hand against a real MongoDB
+(skipped without one, see conftest.py): writer A allocates a sequence
+number, writer B allocates the next one and commits first, and a client
+polls in between.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+pytest.importorskip("motor")
+
+import server
+
+
+def test_committed_change_seq_stops_below_the_lowest_pending_seq():
+    now = datetime.utcnow()
+    counter = {"seq": 12, "pending": [{"seq": 11, "at": now}, {"seq": 9, "at": now}]}
+    assert server.committed_change_seq(counter, now) == 8
+
+
+def test_committed_change_seq_ignores_stale_pending_entries():
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=server.SESSION_CHANGE_PENDING_SECONDS + 1)
+    counter = {"seq": 12, "pending": [{"seq": 9, "at": stale}]}
+    assert server.committed_change_seq(counter, now) == 12
+
+
+def test_committed_change_seq_without_counter():
+    assert server.committed_change_seq(None, datetime.utcnow()) == 0
+    # A user who hasn't written since counters became per user
+    assert server.committed_change_seq({"tombstone_horizon": 3}, datetime.utcnow(), floor=40) == 40
+
+
+def test_change_counters_are_per_user_and_start_above_the_global_one(memory_db):
+    async def scenario():
+        await memory_db.counters.insert_one({"_id": "chat_sessions", "seq": 50})
+        return [await server.next_change_seq(user_id) for user_id in ("alice", "alice", "bob")]
+
+    assert asyncio.run(scenario()) == [51, 52, 51]
+
+
+def test_cursor_older_than_the_tombstone_horizon_gets_a_reset(memory_db):
+    user = server.User(id="alice", email="alice@example.com", username="alice", password_hash="-")
+    expired = datetime.utcnow() - timedelta(seconds=server.SESSION_TOMBSTONE_TTL_SECONDS + 60)
+
+    async def scenario():
+        await memory_db.counters.insert_one({"_id": "chat_sessions:alice", "seq": 10, "pending": []})
+        await memory_db.chat_sessions.insert_one(server.ChatSession(id="kept", user_id="alice", change_seq=9).dict())
+        await memory_db.session_tombstones.insert_many([
+            {"id": "expired", "user_id": "alice", "change_seq": 3, "deleted_at": expired},
+            {"id": "recent", "user_id": "alice", "change_seq": 8, "deleted_at": datetime.utcnow()},
+            {"id": "other user", "user_id": "bob", "change_seq": 2, "deleted_at": expired},
+        ])
+        await server.expire_session_tombstones("alice")
+        pages = {}
+        for since in (2, 3):
+            response = await server.get_session_changes(since=since, limit=server.SESSION_CHANGES_LIMIT, current_user=user)
+            pages[since] = orjson.loads(response.body)
+        left = await memory_db.session_tombstones.find({}, {"_id": 0, "id": 1}).to_list(None)
+        return pages, [tombstone["id"] for tombstone in left]
+
+    pages, left = asyncio.run(scenario())
+    assert left == ["recent", "other user"]
+    # The expired deletion can no longer be reported to a cursor below it
+    assert pages[2]["reset"] and [session["id"] for session in pages[2]["sessions"]] == ["kept"]
+    assert pages[2]["cursor"] == 10
+    assert not pages[3]["reset"]
+    assert pages[3]["deleted"] == ["recent"] and [session["id"] for session in pages[3]["sessions"]] == ["kept"]
+    assert pages[3]["cursor"] == 9
+
+
+def changes(user, since):
+    response = asyncio.get_event_loop().run_until_complete(
+        server.get_session_changes(since=since, limit=server.SESSION_CHANGES_LIMIT, current_user=user)
+    )
+    return orjson.loads(response.body)
+
+
+@pytest.fixture
+def sync_db(mongo):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    database_name = f"kurdcine_session_sync_{uuid.uuid4().hex[:8]}"
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = AsyncIOMotorClient(server.mongo_url, io_loop=loop)
+    previous_db, server.db = server.db, client[database_name]
+    yield server.db
+    server.db = previous_db
+    client.close()
+    loop.close()
+    mongo.drop_database(database_name)
+
+
+def test_cursor_waits_for_a_change_committed_out_of_order(sync_db):
+    user = server.User(email="sync@example.com", username="sync", password_hash="-")
+    run = asyncio.get_event_loop().run_until_complete
+
+    async def write_session(change_seq):
+        session = server.ChatSession(user_id=user.id, change_seq=change_seq)
+        await sync_db.chat_sessions.insert_one(session.dict())
+        return session.id
+
+    async def committed_change():
+        async with server.session_change(user.id) as change_seq:
+            await write_session(change_seq)
+
+    # One committed change first, so the cursor is past 0 (a full reload)
+    run(committed_change())
+    cursor = changes(user, 0)["cursor"]
+    assert cursor > 0
+
+    # A allocates first but is slow; B allocates after A and commits first
+    writer_a = server.session_change(user.id)
+    seq_a = run(writer_a.__aenter__())
+    writer_b = server.session_change(user.id)
+    seq_b = run(writer_b.__aenter__())
+    assert seq_b > seq_a
+    session_b = run(write_session(seq_b))
+    run(writer_b.__aexit__(None, None, None))
+
+    # Neither a full reload nor a delta may move the cursor up to A's number
+    assert changes(user, 0)["cursor"] < seq_a
+    page = changes(user, cursor)
+    assert page["sessions"] == []
+    assert page["cursor"] < seq_a
+    cursor = page["cursor"]
+
+    session_a = run(write_session(seq_a))
+    run(writer_a.__aexit__(None, None, None))
+
+    page = changes(user, cursor)
+    assert [session["id"] for session in page["sessions"]] == [session_a, session_b]
+    assert page["cursor"] == seq_b
+    assert changes(user, page["cursor"])["sessions"] == []
@@ -0,0 +1,220 @@
+"""Trace propagation, request and Mongo spans, and the span exporters."""
+
+import threading
+import types
+
+import orjson
+import pytest
+
+pytest.importorskip("pymongo")
+
+from tracing import FileExporter, MongoCommandListener, StreamExporter, Tracer, TracingMiddleware
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+
+def make_tracer(sample_rate=1.0):
+    return Tracer("test", ListExporter(), sample_rate=sample_rate)
+
+
+def test_root_span_continues_a_valid_traceparent():
+    span = make_tracer(sample_rate=0).start_span("root", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (span.trace_id, span.parent_id, span.sampled) == (TRACE_ID, PARENT_ID, True)
+    assert span.traceparent == f"00-{TRACE_ID}-{span.span_id}-01"
+
+
+def test_sampled_flag_is_inherited_from_the_caller():
+    tracer = make_tracer(sample_rate=1.0)
+    root = tracer.start_span("root", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-00")
+    assert not root.sampled
+    child = tracer.start_span("child", parent=root)
+    assert (child.trace_id, child.parent_id, child.sampled) == (TRACE_ID, root.span_id, False)
+    child.end()
+    root.end()
+    assert tracer.exporter.spans == []
+
+
+@pytest.mark.parametrize("traceparent", [
+    None,
+    "",
+    f"01-{TRACE_ID}-{PARENT_ID}-01",
+    f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+    f"00-{TRACE_ID}-{PARENT_ID[:-1]}-01",
+])
+def test_missing_or_malformed_traceparent_starts_a_new_trace(traceparent):
+    span = make_tracer(sample_rate=1.0).start_span("root", traceparent=traceparent)
+    assert span.trace_id != TRACE_ID and len(span.trace_id) == 32
+    assert span.parent_id is None and span.sampled
+    assert not make_tracer(sample_rate=0).start_span("root", traceparent=traceparent).sampled
+
+
+def test_span_context_nests_and_records_errors():
+    tracer = make_tracer()
+    with tracer.span("outer") as outer:
+        with pytest.raises(ValueError):
+            with tracer.span("inner", step=1):
+                raise ValueError("boom")
+    inner, exported_outer = tracer.exporter.spans
+    assert exported_outer is outer
+    assert inner.parent_id == outer.span_id
+    assert inner.attributes == {"step": 1}
+    assert (inner.status, inner.status_message) == ("ERROR", "ValueError: boom")
+    assert outer.status == "UNSET"
+
+
+def test_request_span_is_named_after_the_endpoint():
+    fastapi = pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    tracer = make_tracer()
+    app = fastapi.FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        with tracer.span("lookup"):
+            return {"id": item_id}
+
+    @app.get("/broken")
+    async def broken():
+        raise fastapi.HTTPException(status_code=503)
+
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    client = TestClient(app)
+    response = client.get("/items/123", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+    assert response.headers["x-trace-id"] == TRACE_ID
+
+    lookup, request = tracer.exporter.spans
+    assert request.name == "GET get_item"
+    assert (request.kind, request.parent_id) == ("SERVER", PARENT_ID)
+    assert request.attributes == {"http.method": "GET", "http.target": "/items/123", "http.status_code": 200}
+    assert lookup.parent_id == request.span_id
+
+    client.get("/broken")
+    failed = tracer.exporter.spans[-1]
+    assert failed.name == "GET broken"
+    assert failed.status == "ERROR"
+
+
+def command_event(request_id, command_name="find", **extra):
+    return types.SimpleNamespace(
+        command={command_name: "chat_messages", "filter": {}},
+        command_name=command_name,
+        database_name="kurdcine",
+        request_id=request_id,
+        connection_id=("localhost", 27017),
+        **extra,
+    )
+
+
+def test_mongo_commands_become_child_spans_of_the_issuing_span():
+    tracer = make_tracer()
+    listener = MongoCommandListener(tracer)
+    # No current span (e.g. startup): nothing is recorded
+    listener.started(command_event(1))
+    listener.succeeded(command_event(1))
+    assert tracer.exporter.spans == []
+
+    with tracer.span("request") as request:
+        listener.started(command_event(2))
+        listener.started(command_event(3, "insert"))
+    # Completions may arrive on another thread, outside the request context
+    listener.failed(command_event(3, "insert", failure={"errmsg": "duplicate key"}))
+    listener.succeeded(command_event(2))
+
+    request_span, insert, find = tracer.exporter.spans
+    assert request_span is request
+    assert find.name == "mongo.find" and insert.name == "mongo.insert"
+    assert find.parent_id == insert.parent_id == request.span_id
+    assert find.attributes["db.mongodb.collection"] == "chat_messages"
+    assert find.kind == "CLIENT" and find.status == "UNSET"
+    assert (insert.status, insert.status_message) == ("ERROR", "duplicate key")
+
+
+class GatedStream:
+    """Text stream whose writes wait on `gate`, recording each write and flush."""
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+        self.writing = threading.Event()
+        self.gate = threading.Event()
+
+    def write(self, text):
+        self.writing.set()
+        self.gate.wait(5)
+        self.writes.append(text)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def span_names(writes):
+    return [[orjson.loads(line)["name"] for line in text.splitlines()] for text in writes]
+
+
+def test_stream_exporter_writes_in_batches_and_drains_on_shutdown():
+    stream = GatedStream()
+    exporter = StreamExporter(stream, batch_size=10)
+    tracer = Tracer("test", exporter)
+
+    tracer.start_span("span-0").end()
+    assert stream.writing.wait(5)
+    # The writer is busy with the first span; the rest queue up behind it
+    for i in range(1, 25):
+        tracer.start_span(f"span-{i}").end()
+    stream.gate.set()
+    exporter.shutdown()
+
+    names = span_names(stream.writes)
+    assert [len(batch) for batch in names] == [1, 10, 10, 4]
+    assert sum(names, []) == [f"span-{i}" for i in range(25)]
+    assert stream.flushes == len(stream.writes)
+    assert exporter.dropped == 0
+
+    # Exporting after shutdown starts a new writer
+    tracer.start_span("late").end()
+    exporter.shutdown()
+    assert span_names(stream.writes[-1:]) == [["late"]]
+
+
+def test_stream_exporter_drops_spans_over_the_queue_limit():
+    stream = GatedStream()
+    exporter = StreamExporter(stream, max_queue=3)
+    tracer = Tracer("test", exporter)
+    tracer.start_span("first").end()
+    assert stream.writing.wait(5)
+    for i in range(5):
+        tracer.start_span(f"queued-{i}").end()
+    assert exporter.dropped == 2
+    stream.gate.set()
+    exporter.shutdown()
+    assert sum(span_names(stream.writes), []) == ["first", "queued-0", "queued-1", "queued-2"]
+
+
+def test_file_exporter_opens_on_first_export_and_closes_on_shutdown(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = FileExporter(str(path))
+    tracer = Tracer("test", exporter)
+    assert not path.exists()
+    exporter.shutdown()
+
+    tracer.start_span("first").end()
+    stream = exporter.stream
+    exporter.shutdown()
+    assert stream.closed and exporter.stream is None
+
+    tracer.start_span("second").end()
+    exporter.shutdown()
+    assert [orjson.loads(line)["name"] for line in path.read_text().splitlines()] == ["first", "second"]